@@ -0,0 +1,118 @@
+"""
+bench_common - Baseline handling and reporting shared by the benchmark scripts
+Argument parsing, the results table, baseline comparison and the save/compare flow
+"""
+
+import argparse
+import json
+import platform
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# (title, width, format) of a table column; format gets the result and its baseline entry
+Column = Tuple[str, int, Callable[[dict, dict], str]]
+
+
+def csv_choices(value: str, allowed, lower: bool = False) -> List[str]:
+    """Parse a comma-separated command line value, rejecting items not in ``allowed``."""
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    if lower:
+        items = [item.lower() for item in items]
+    unknown = [item for item in items if item not in allowed]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown value(s) {unknown}, choose from {list(allowed)}")
+    return items
+
+
+def add_baseline_arguments(parser: argparse.ArgumentParser, default_baseline: Path, tolerance: float):
+    """Add the ``--baseline``, ``--save-baseline``, ``--tolerance`` and ``--output`` options."""
+    parser.add_argument('--baseline', type=Path, default=default_baseline)
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=tolerance,
+                        help=f"Allowed slowdown/growth before a result counts as a regression (default: {tolerance})")
+    parser.add_argument('--output', type=Path, help="Also write the results to this JSON file")
+
+
+def load_baseline(path: Path) -> Dict[str, dict]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding='utf-8')).get('results', {})
+
+
+def compare_with_baseline(results, baseline, tolerance: float, metrics: Sequence[str]) -> List[str]:
+    """Return a list of human-readable regressions of ``metrics`` against ``baseline``."""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None or 'error' in previous:
+            continue
+        if 'error' in current:
+            regressions.append(f"{key}: fails: {current['error']}")
+            continue
+        for metric in metrics:
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append(f"{key}: {metric} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_table(results, baseline, key_title: str, key_width: int, columns: Sequence[Column]):
+    header = f"{key_title:<{key_width}} " + ' '.join(f"{title:>{width}}" for title, width, _ in columns)
+    print(header)
+    print('-' * len(header))
+    for key, r in results.items():
+        if 'error' in r:
+            print(f"{key:<{key_width}} error: {r['error']}")
+            continue
+        base = baseline.get(key, {})
+        print(f"{key:<{key_width}} " + ' '.join(f"{fmt(r, base):>{width}}" for _, width, fmt in columns))
+
+
+def base_value(metric: str) -> Callable[[dict, dict], str]:
+    """Table column formatter showing ``metric`` of the baseline entry, '-' without one."""
+    return lambda result, base: f"{base[metric]:.1f}" if base.get(metric) else '-'
+
+
+def report(results, baseline, args, meta: Dict, regressions: Callable[[dict, dict], List[str]]) -> int:
+    """Write/save the results as requested by the baseline options; return the exit code.
+
+    Args:
+        results: Results of this run, by key
+        baseline: Stored baseline results (empty if there is none)
+        args: Parsed arguments, see ``add_baseline_arguments``
+        meta: Run details stored next to the results, besides Python and platform
+        regressions: Returns the regressions of the results against the baseline
+    """
+    document = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            **meta,
+        },
+        'results': results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(document, indent=2), encoding='utf-8')
+
+    if args.save_baseline:
+        merged = dict(baseline)
+        merged.update(results)
+        document['results'] = merged
+        args.baseline.write_text(json.dumps(document, indent=2), encoding='utf-8')
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+
+    found = regressions(results, baseline)
+    if found:
+        print(f"\n{len(found)} regression(s) beyond {args.tolerance:.0%}:")
+        for line in found:
+            print(f"  {line}")
+        return 1
+    print("\nNo regressions against baseline.")
+    return 0
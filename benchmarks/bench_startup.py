@@ -0,0 +1,115 @@
+"""
+bench_startup - Import latency benchmark for the Robot Framework libraries
+Times each library's import and instantiation in fresh interpreters, as robot --dryrun, libdoc and pabot workers pay it
+
+Usage:
+    python benchmarks/bench_startup.py                     # run and compare with the stored baseline
+    python benchmarks/bench_startup.py --save-baseline     # store the results as the new baseline
+    python benchmarks/bench_startup.py --libraries ImageComparisonLibrary --repeat 10
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+from bench_common import (add_baseline_arguments, base_value, compare_with_baseline, csv_choices, load_baseline,
+                          print_table, report)
+
+BENCH_DIR = Path(__file__).resolve().parent
+LIBRARIES_DIR = BENCH_DIR.parent / 'libraries'
+
+DEFAULT_BASELINE = BENCH_DIR / 'startup_baseline.json'
+LIBRARIES = ('ImageComparisonLibrary', 'VideoRecorderLibrary', 'WindowControlLibrary',
+             'ProcessControlLibrary', 'SikuliHelper', 'VisualMetricsListener')
+# Modules that should only be imported once a keyword needs them
+HEAVY_MODULES = ('cv2', 'numpy', 'PIL', 'skimage', 'pyautogui', 'psutil')
+
+# Runs in a fresh interpreter. Robot Framework itself is imported first, because
+# it is already loaded whenever robot, libdoc or pabot imports a library.
+_PROBE = """
+import importlib, json, sys, time
+sys.path.insert(0, {libraries_dir!r})
+import robot.api, robot.libraries.BuiltIn
+before = set(sys.modules)
+start = time.perf_counter()
+module = importlib.import_module({name!r})
+imported = time.perf_counter()
+getattr(module, {name!r})()
+created = time.perf_counter()
+heavy = sorted(m for m in {heavy!r} if m in sys.modules and m not in before)
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'init_ms': (created - imported) * 1000,
+    'modules': len(set(sys.modules) - before),
+    'heavy': heavy,
+}}))
+"""
+
+
+def probe(name: str) -> dict:
+    code = _PROBE.format(libraries_dir=str(LIBRARIES_DIR), name=name, heavy=HEAVY_MODULES)
+    completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'error': (completed.stderr.strip().splitlines() or ['failed'])[-1]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def bench_library(name: str, repeat: int) -> dict:
+    runs = [probe(name) for _ in range(repeat)]
+    errors = [run['error'] for run in runs if 'error' in run]
+    if errors:
+        return {'error': errors[0]}
+    return {
+        'import_ms': round(statistics.median(run['import_ms'] for run in runs), 3),
+        'init_ms': round(statistics.median(run['init_ms'] for run in runs), 3),
+        'modules': runs[-1]['modules'],
+        'heavy': runs[-1]['heavy'],
+    }
+
+
+def find_regressions(results, baseline, tolerance: float):
+    """Slower imports, plus heavy modules that are now imported at startup."""
+    regressions = compare_with_baseline(results, baseline, tolerance, ('import_ms', 'init_ms'))
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None or 'error' in previous or 'error' in current:
+            continue
+        added = sorted(set(current['heavy']) - set(previous.get('heavy', [])))
+        if added:
+            regressions.append(f"{key}: now imports {', '.join(added)} at startup")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the libraries.")
+    parser.add_argument('--libraries', type=lambda v: csv_choices(v, LIBRARIES), default=list(LIBRARIES))
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per library (default: 5)")
+    add_baseline_arguments(parser, DEFAULT_BASELINE, tolerance=0.3)
+    args = parser.parse_args(argv)
+
+    print(f"Importing {len(args.libraries)} librar{'y' if len(args.libraries) == 1 else 'ies'} "
+          f"in {args.repeat} fresh interpreter(s) each")
+    results = {}
+    for name in args.libraries:
+        print(f"  {name} ...", flush=True)
+        results[name] = bench_library(name, args.repeat)
+    baseline = load_baseline(args.baseline)
+
+    print()
+    print_table(results, baseline, 'library', 24, [
+        ('import ms', 10, lambda r, base: f"{r['import_ms']:.1f}"),
+        ('base ms', 9, base_value('import_ms')),
+        ('init ms', 9, lambda r, base: f"{r['init_ms']:.1f}"),
+        ('modules', 8, lambda r, base: str(r['modules'])),
+        ('heavy imports', 14, lambda r, base: ', '.join(r['heavy']) or '-'),
+    ])
+
+    return report(results, baseline, args, {'repeat': args.repeat},
+                  lambda results, baseline: find_regressions(results, baseline, args.tolerance))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+bench_visual - Benchmark suite for ImageComparisonLibrary and VideoRecorderLibrary
+Runs headless against synthetic images and a synthetic capture source
+
+Usage:
+    python benchmarks/bench_visual.py                      # run and compare with the stored baseline
+    python benchmarks/bench_visual.py --save-baseline      # store the results as the new baseline
+    python benchmarks/bench_visual.py --resolutions 720p --cases mse,diff
+"""
+
+import argparse
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / 'libraries'))
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import ImageComparisonLibrary as image_module
+import VideoRecorderLibrary as video_module
+from ImageComparisonLibrary import ImageComparisonLibrary
+from VideoRecorderLibrary import VideoRecorderLibrary
+
+from bench_common import (add_baseline_arguments, base_value, compare_with_baseline, csv_choices, load_baseline,
+                          print_table, report)
+
+
+DEFAULT_BASELINE = BENCH_DIR / 'baseline.json'
+RESOLUTIONS = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160),
+}
+PAIRS = ('identical', 'noisy', 'shifted')
+CASES = ('mse', 'diff', 'log_html', 'compare', 'compare_patches', 'record')
+RECORD_SECONDS = 1.0
+RECORD_FPS = 1000.0  # effectively uncapped, so the loop runs at its per-frame cost
+
+
+class _CapturingLogger:
+    """Stand-in for robot.api.logger that counts the bytes sent to the log."""
+
+    def __init__(self):
+        self.bytes_logged = 0
+
+    def _log(self, msg, *args, **kwargs):
+        self.bytes_logged += len(str(msg).encode('utf-8'))
+
+    info = debug = warn = trace = error = _log
+
+
+class SyntheticScreen:
+    """Capture source cycling through pre-rendered frames with a moving window."""
+
+    def __init__(self, width: int, height: int, frames: int = 8):
+        base = make_ui_image(width, height, seed=7)
+        self.frames = []
+        for i in range(frames):
+            frame = base.copy()
+            x = (i * width // frames) % max(1, width - 200)
+            cv2.rectangle(frame, (x, height // 3), (x + 200, height // 3 + 120), (40, 40, 200), -1)
+            self.frames.append(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+        self.grabs = 0
+        self.grab_times = []
+
+    def grab(self):
+        frame = self.frames[self.grabs % len(self.frames)]
+        self.grabs += 1
+        self.grab_times.append(time.perf_counter())
+        return frame
+
+
+def make_ui_image(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """Render a deterministic, UI-like BGR test image."""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(200, 250, width, dtype=np.float32)
+    img = np.repeat(np.tile(gradient, (height, 1))[:, :, None], 3, axis=2).astype(np.uint8)
+    for _ in range(40):
+        x, y = int(rng.integers(0, width - 50)), int(rng.integers(0, height - 30))
+        w, h = int(rng.integers(40, width // 4)), int(rng.integers(20, height // 6))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(img, (x, y), (min(width - 1, x + w), min(height - 1, y + h)), color, -1)
+    for i in range(25):
+        x, y = int(rng.integers(0, width - 300)), int(rng.integers(20, height))
+        cv2.putText(img, f"AgileMark label {i}", (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (20, 20, 20), 2)
+    return img
+
+
+def make_pair(width: int, height: int, kind: str):
+    expected = make_ui_image(width, height)
+    if kind == 'identical':
+        actual = expected.copy()
+    elif kind == 'noisy':
+        noise = np.random.default_rng(1).normal(0, 6, expected.shape)
+        actual = np.clip(expected.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+    elif kind == 'shifted':
+        actual = np.roll(expected, shift=(3, 5), axis=(0, 1))
+    else:
+        raise ValueError(f"Unknown pair kind: {kind}")
+    return expected, actual
+
+
+def _dir_bytes(directory: Path) -> int:
+    return sum(p.stat().st_size for p in directory.rglob('*') if p.is_file())
+
+
+def measure(func, repeat: int):
+    """Run ``func`` ``repeat`` times, then once more under tracemalloc.
+
+    ``func`` returns the number of artifact bytes it produced.
+    """
+    timings = []
+    artifact_bytes = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        artifact_bytes = func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'peak_kb': round(peak / 1024, 1),
+        'artifact_bytes': int(artifact_bytes or 0),
+    }
+
+
+def bench_image_case(case: str, resolution: str, pair: str, work_dir: Path, repeat: int):
+    width, height = RESOLUTIONS[resolution]
+    expected, actual = make_pair(width, height, pair)
+    case_dir = work_dir / f"{case}_{resolution}_{pair}"
+    case_dir.mkdir(parents=True)
+    expected_path, actual_path = case_dir / 'expected.png', case_dir / 'actual.png'
+    cv2.imwrite(str(expected_path), expected)
+    cv2.imwrite(str(actual_path), actual)
+
+    library = ImageComparisonLibrary()
+    out_dir = case_dir / 'out'
+    library.output_dir = out_dir
+    capture = _CapturingLogger()
+
+    def reset_output():
+        shutil.rmtree(out_dir, ignore_errors=True)
+        out_dir.mkdir(parents=True)
+        capture.bytes_logged = 0
+
+    if case == 'mse':
+        def run():
+            library._calculate_similarity_mse(expected, actual)
+            return 0
+    elif case == 'diff':
+        def run():
+            reset_output()
+            library._create_diff_image(str(expected_path), str(actual_path), str(out_dir / 'diff.png'))
+            return _dir_bytes(out_dir)
+    elif case == 'log_html':
+        reset_output()
+        library._create_diff_image(str(expected_path), str(actual_path), str(case_dir / 'diff.png'))
+
+        def run():
+            capture.bytes_logged = 0
+            library._log_comparison_html(str(expected_path), str(actual_path), str(case_dir / 'diff.png'),
+                                         99.0, 'MSE', True)
+            return capture.bytes_logged
+    elif case == 'compare':
+        def run():
+            reset_output()
+            library.compare_images(str(expected_path), str(actual_path), 95.0)
+            return _dir_bytes(out_dir) + capture.bytes_logged
+    elif case == 'compare_patches':
+        def run():
+            reset_output()
+            library.compare_images(str(expected_path), str(actual_path), 95.0, diff_mode='patches')
+            return _dir_bytes(out_dir) + capture.bytes_logged
+    else:
+        raise ValueError(f"Unknown image case: {case}")
+
+    original_logger = image_module.logger
+    image_module.logger = capture
+    try:
+        return measure(run, repeat)
+    finally:
+        image_module.logger = original_logger
+
+
+def bench_record(resolution: str, work_dir: Path):
+    """Record the synthetic screen for a fixed time and report per-frame cost.
+
+    The capture loop is uncapped, so the time between two grabs is what one
+    frame costs it; ``median_ms`` and ``min_ms`` are taken over those intervals.
+    """
+    width, height = RESOLUTIONS[resolution]
+    screen = SyntheticScreen(width, height)
+    recorder = VideoRecorderLibrary()
+    recorder.output_dir = work_dir / f"record_{resolution}"
+    recorder._grab_screen = screen.grab
+
+    original_logger = video_module.logger
+    video_module.logger = _CapturingLogger()
+    try:
+        tracemalloc.start()
+        recorder.start_video_recording('bench', fps=RECORD_FPS)
+        time.sleep(RECORD_SECONDS)
+        video_path = recorder.stop_video_recording()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        video_module.logger = original_logger
+
+    # The first grab only sizes the writer
+    grab_times = screen.grab_times[1:]
+    intervals = [(end - start) * 1000 for start, end in zip(grab_times, grab_times[1:])]
+    if not intervals:
+        intervals = [RECORD_SECONDS * 1000]
+    achieved_fps = max(1, len(grab_times)) / RECORD_SECONDS
+    return {
+        'median_ms': round(statistics.median(intervals), 3),
+        'min_ms': round(min(intervals), 3),
+        'peak_kb': round(peak / 1024, 1),
+        'artifact_bytes': Path(video_path).stat().st_size if video_path else 0,
+        'fps': round(achieved_fps, 1),
+    }
+
+
+def run_benchmarks(resolutions, pairs, cases, repeat: int):
+    results = {}
+    work_dir = Path(tempfile.mkdtemp(prefix='agilemark_bench_'))
+    try:
+        for resolution in resolutions:
+            for case in cases:
+                if case == 'record':
+                    key = f"record/{resolution}"
+                    print(f"  {key} ...", flush=True)
+                    results[key] = bench_record(resolution, work_dir)
+                    continue
+                for pair in pairs:
+                    key = f"{case}/{resolution}/{pair}"
+                    print(f"  {key} ...", flush=True)
+                    results[key] = bench_image_case(case, resolution, pair, work_dir, repeat)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the image and video libraries.")
+    parser.add_argument('--resolutions', type=lambda v: csv_choices(v, RESOLUTIONS, lower=True),
+                        default=list(RESOLUTIONS))
+    parser.add_argument('--pairs', type=lambda v: csv_choices(v, PAIRS, lower=True), default=list(PAIRS))
+    parser.add_argument('--cases', type=lambda v: csv_choices(v, CASES, lower=True), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per case (default: 5)")
+    add_baseline_arguments(parser, DEFAULT_BASELINE, tolerance=0.2)
+    args = parser.parse_args(argv)
+
+    print(f"Running {len(args.cases)} case(s) at {', '.join(args.resolutions)}")
+    results = run_benchmarks(args.resolutions, args.pairs, args.cases, args.repeat)
+    baseline = load_baseline(args.baseline)
+
+    print()
+    print_table(results, baseline, 'case', 32, [
+        ('median ms', 11, lambda r, base: f"{r['median_ms']:.1f}"),
+        ('base ms', 9, base_value('median_ms')),
+        ('peak KB', 11, lambda r, base: f"{r['peak_kb']:.0f}"),
+        ('artifact B', 12, lambda r, base: str(r['artifact_bytes'])),
+    ])
+
+    meta = {'opencv': cv2.__version__, 'numpy': np.__version__, 'repeat': args.repeat}
+    return report(results, baseline, args, meta, lambda results, baseline: compare_with_baseline(
+        results, baseline, args.tolerance, ('median_ms', 'peak_kb', 'artifact_bytes')))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+ProcessControlLibrary - Robot Framework Library for process control
+Finds, kills and waits for processes by name in-process (psutil), without tasklist/PowerShell round trips
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Dict, List
+
+from robot.api import logger
+from robot.utils import timestr_to_secs
+
+from lazy_imports import LazyModule
+
+psutil = LazyModule('psutil', 'psutil')
+
+
+def normalize_name(name: str) -> str:
+    """Process name as compared: lower case, without a trailing ``.exe``."""
+    name = str(name).strip().lower()
+    return name[:-4] if name.endswith('.exe') else name
+
+
+class ProcessControlLibrary:
+    """Library for finding, killing and waiting for processes by name.
+    
+    Processes are enumerated in-process with psutil, so each keyword costs a
+    few milliseconds instead of spawning ``tasklist`` or PowerShell, and works
+    the same on Windows and Linux.
+    
+    = Process names =
+    
+    Names are matched case-insensitively against the executable name, and the
+    ``.exe`` suffix is optional: ``AgileMark``, ``agilemark.exe`` and
+    ``AgileMark.exe`` all match ``AgileMark.exe``. All keywords accept several
+    names and look them all up in a single pass over the process table.
+    
+    = Waiting =
+    
+    `Wait Until Process Exits` waits on the matching processes themselves
+    (``psutil.wait_procs``: a process handle wait on Windows, ``waitpid`` for
+    child processes), so it returns as soon as the last one is gone instead of
+    after a fixed sleep. `Wait Until Process Started` polls the process table
+    every ``interval``. Timeouts and intervals use the Robot Framework time
+    format (``10s``, ``1 min``, ``500ms``).
+    """
+    
+    ROBOT_LIBRARY_SCOPE = 'GLOBAL'
+    ROBOT_LIBRARY_VERSION = '1.0.0'
+    
+    def _find(self, names) -> Dict[str, list]:
+        """Map each requested name to its running ``psutil.Process`` objects (one process table pass)."""
+        if not names:
+            raise ValueError("At least one process name is required")
+        # Equivalent spellings (``AgileMark``, ``agilemark.exe``) each get the processes
+        wanted: Dict[str, List[str]] = {}
+        for name in dict.fromkeys(names):
+            wanted.setdefault(normalize_name(name), []).append(name)
+        found = {name: [] for name in names}
+        for proc in psutil.process_iter(['name', 'status']):
+            name = proc.info['name']
+            # Zombies have exited already, only their parent has not reaped them yet
+            if name and normalize_name(name) in wanted and proc.info['status'] != psutil.STATUS_ZOMBIE:
+                for requested in wanted[normalize_name(name)]:
+                    found[requested].append(proc)
+        return found
+    
+    def _find_all(self, names) -> list:
+        """Running processes matching any of ``names``, each once."""
+        procs = {}
+        for found in self._find(names).values():
+            for proc in found:
+                procs.setdefault(proc.pid, proc)
+        return list(procs.values())
+    
+    def get_processes_by_name(self, *names) -> Dict[str, List[int]]:
+        """Get the process IDs of all running processes with the given names.
+        
+        Args:
+            *names: Process names, e.g. ``AgileMark.exe`` (see `Process names`)
+            
+        Returns:
+            Dictionary mapping each given name to a list of process IDs (empty if not running)
+            
+        Examples:
+        | ${pids}= | Get Processes By Name | AgileMark.exe | AgileService.exe |
+        | Should Be Empty | ${pids}[AgileMark.exe] |
+        """
+        found = self._find(names)
+        pids = {name: sorted(proc.pid for proc in procs) for name, procs in found.items()}
+        logger.info(', '.join(f"{name}: {len(ids)} running" + (f" (PID {', '.join(map(str, ids))})" if ids else '')
+                              for name, ids in pids.items()))
+        return pids
+    
+    def is_process_running_by_name(self, *names) -> bool:
+        """Return True if any process with one of the given names is running.
+        
+        Args:
+            *names: Process names (see `Process names`)
+            
+        Examples:
+        | ${running}= | Is Process Running By Name | AgileService.exe |
+        | Run Keyword If | ${running} | Log | AgileService is up |
+        """
+        return any(self._find(names).values())
+    
+    def kill_processes_by_name(self, *names, timeout='5s', graceful: bool = False) -> int:
+        """Kill all processes with the given names and wait until they are gone.
+        
+        Processes that are not running are ignored. The keyword fails if a
+        process cannot be killed (e.g. access denied to a service running as
+        another user) or is still running after ``timeout``.
+        
+        Args:
+            *names: Process names (see `Process names`)
+            timeout: Maximum time to wait for the processes to exit
+            graceful: Ask the processes to terminate first (SIGTERM; on Windows
+                this is the same as killing) and only kill those still running
+                after ``timeout``
+                
+        Returns:
+            Number of processes that were killed
+            
+        Examples:
+        | Kill Processes By Name | AgileMark.exe | AgileService.exe |
+        | ${killed}= | Kill Processes By Name | AgileMark | timeout=10s | graceful=True |
+        """
+        timeout = timestr_to_secs(timeout)
+        procs = self._find_all(names)
+        if not procs:
+            logger.info(f"No process named {', '.join(names)} is running")
+            return 0
+        
+        denied = []
+        signalled = []
+        for proc in procs:
+            try:
+                if graceful:
+                    proc.terminate()
+                else:
+                    proc.kill()
+                signalled.append(proc)
+            except psutil.NoSuchProcess:
+                pass
+            except psutil.AccessDenied:
+                denied.append(proc)
+        
+        gone, alive = psutil.wait_procs(signalled, timeout=timeout)
+        if graceful and alive:
+            for proc in alive:
+                try:
+                    proc.kill()
+                except psutil.NoSuchProcess:
+                    pass
+                except psutil.AccessDenied:
+                    denied.append(proc)
+            more_gone, alive = psutil.wait_procs([p for p in alive if p not in denied], timeout=timeout)
+            gone += more_gone
+        
+        if gone:
+            logger.info(f"Killed {len(gone)} process(es): " + ', '.join(self._describe(p) for p in gone))
+        problems = [f"{self._describe(p)}: access denied" for p in denied]
+        problems += [f"{self._describe(p)}: still running after {timeout:g}s" for p in alive]
+        if problems:
+            raise AssertionError(f"Could not kill {len(problems)} process(es):\n" + '\n'.join(problems))
+        return len(gone)
+    
+    def wait_until_process_exits(self, *names, timeout='10s', interval='0.2s') -> float:
+        """Wait until no process with any of the given names is running.
+        
+        The keyword waits on the running processes themselves and returns as
+        soon as the last one exits. A process with one of the names started
+        while waiting is waited for too.
+        
+        Args:
+            *names: Process names (see `Process names`)
+            timeout: Maximum time to wait
+            interval: How often to look for newly started processes with the names
+            
+        Returns:
+            Seconds waited
+            
+        Examples:
+        | Wait Until Process Exits | AgileMark.exe | AgileService.exe | timeout=15s |
+        | ${seconds}= | Wait Until Process Exits | setup.exe | timeout=2 min |
+        """
+        timeout = timestr_to_secs(timeout)
+        interval = timestr_to_secs(interval)
+        start = time.monotonic()
+        while True:
+            procs = self._find_all(names)
+            if not procs:
+                elapsed = time.monotonic() - start
+                logger.info(f"No process named {', '.join(names)} is running (waited {elapsed:.2f}s)")
+                return round(elapsed, 3)
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                raise AssertionError(f"Process(es) still running after {timeout:g} seconds: "
+                                     + ', '.join(self._describe(p) for p in procs))
+            # Returns as soon as all of them have exited; then look again for new ones
+            psutil.wait_procs(procs, timeout=min(remaining, interval))
+    
+    def wait_until_process_started(self, *names, timeout='10s', interval='0.2s') -> Dict[str, List[int]]:
+        """Wait until at least one process with each of the given names is running.
+        
+        Args:
+            *names: Process names (see `Process names`)
+            timeout: Maximum time to wait
+            interval: Time between checks of the process table
+            
+        Returns:
+            Dictionary mapping each given name to the list of its process IDs
+            
+        Examples:
+        | Wait Until Process Started | AgileService.exe | timeout=30s |
+        | ${pids}= | Wait Until Process Started | AgileMark.exe | AgileService.exe |
+        """
+        timeout = timestr_to_secs(timeout)
+        interval = timestr_to_secs(interval)
+        start = time.monotonic()
+        while True:
+            tick_start = time.monotonic()
+            found = self._find(names)
+            missing = [name for name, procs in found.items() if not procs]
+            if not missing:
+                logger.info(f"Process(es) {', '.join(names)} running after {time.monotonic() - start:.2f}s")
+                return {name: sorted(proc.pid for proc in procs) for name, procs in found.items()}
+            if time.monotonic() - start >= timeout:
+                raise AssertionError(f"Process(es) not started within {timeout:g} seconds: {', '.join(missing)}")
+            time.sleep(max(0.0, interval - (time.monotonic() - tick_start)))
+    
+    @staticmethod
+    def _describe(proc) -> str:
+        return f"{proc.info['name']} (PID {proc.pid})"
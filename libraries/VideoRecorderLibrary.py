@@ -3,18 +3,27 @@ VideoRecorderLibrary - Robot Framework Library for Screen Recording
 Provides screen recording capabilities with HTML report embedding
 """
 
+from __future__ import annotations
+
 import os
-import cv2
-import numpy as np
+import queue
 import threading
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
-from PIL import ImageGrab
+from typing import List, Optional
 from robot.api import logger
 from robot.libraries.BuiltIn import BuiltIn
 
+from lazy_imports import LazyModule
+from visual_metrics import METRICS
+from artifact_writer import get_artifact_writer
+import video_search
+
+cv2 = LazyModule('cv2', 'opencv-python')
+np = LazyModule('numpy', 'numpy')
+ImageGrab = LazyModule('PIL.ImageGrab', 'Pillow')
+
 
 class VideoRecorderLibrary:
     """Library for recording screen during test execution and embedding in reports.
@@ -25,14 +34,35 @@ class VideoRecorderLibrary:
     
     ROBOT_LIBRARY_SCOPE = 'TEST'
     ROBOT_LIBRARY_VERSION = '1.0.0'
+    ROBOT_LISTENER_API_VERSION = 2
     
-    def __init__(self):
+    def __init__(self, async_artifacts: bool = False):
+        """Import the library.
+        
+        Args:
+            async_artifacts: Write the frame index of recorded videos in the
+                background, through the writer shared with ImageComparisonLibrary.
+                Pending writes are flushed when the test ends.
+        
+        Examples:
+        | Library | VideoRecorderLibrary.py | async_artifacts=True |
+        """
         self.recording = False
         self.video_writer = None
         self.record_thread = None
+        self.encode_thread = None
+        self.frame_queue = None
         self.output_dir = None
         self.current_video_path = None
         self.fps = 10.0
+        self.screen_size = None
+        self._stats = {}
+        self._frame_index = {}
+        self._index_regions = []
+        self._writer = get_artifact_writer() if async_artifacts else None
+        if self._writer is not None:
+            # Library listener: flush pending artifacts when the library goes out of scope
+            self.ROBOT_LIBRARY_LISTENER = self
         
     def _get_output_dir(self) -> Path:
         """Get the Robot Framework output directory."""
@@ -47,24 +77,39 @@ class VideoRecorderLibrary:
         self.output_dir.mkdir(parents=True, exist_ok=True)
         return self.output_dir
     
-    def start_video_recording(self, filename: Optional[str] = None, fps: float = 10.0):
+    def _grab_screen(self):
+        """Grab the full screen as a PIL RGB image."""
+        return ImageGrab.grab()
+    
+    def start_video_recording(self, filename: Optional[str] = None, fps: float = 10.0,
+                              index_regions=None):
         """Start recording the screen.
         
         Args:
             filename: Optional filename for the video (without extension). 
                      If not provided, will use timestamp.
             fps: Frames per second for the recording (default: 10.0)
+            index_regions: Frame areas (``x,y,width,height``, several separated
+                by ``;`` or given as a list) that `Find Frame Matching Image`
+                will search with ``region``; they are indexed while recording,
+                like the full frame
+        
+        Frames are encoded on a separate thread. When encoding cannot keep up,
+        new frames are dropped instead of slowing down the capture, and
+        `Stop Video Recording` warns how many were lost.
         
         Example:
             | Start Video Recording |
             | Start Video Recording | my_test_video |
             | Start Video Recording | my_test_video | 15.0 |
+            | Start Video Recording | install | index_regions=0,0,1920,1035 |
         """
         if self.recording:
             logger.warn("Video recording is already in progress. Stopping previous recording.")
             self.stop_video_recording()
         
         self.fps = fps
+        self._index_regions = self._parse_index_regions(index_regions)
         output_dir = self._get_output_dir()
         
         # Create video subdirectory
@@ -81,8 +126,14 @@ class VideoRecorderLibrary:
         self.current_video_path = video_dir / f"{filename}.mp4"
         
         # Get screen size
-        screen = ImageGrab.grab()
+        screen = self._grab_screen()
         screen_size = screen.size
+        self.screen_size = screen_size
+        for x, y, w, h in self._index_regions:
+            if x < 0 or y < 0 or w <= 0 or h <= 0 or x + w > screen_size[0] or y + h > screen_size[1]:
+                raise ValueError(f"Index region {x},{y},{w},{h} is not inside the "
+                                 f"{screen_size[0]}x{screen_size[1]} screen")
+        self._frame_index = {video_search.region_key(region): [] for region in [None] + self._index_regions}
         
         # Initialize video writer
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
@@ -97,30 +148,62 @@ class VideoRecorderLibrary:
             raise RuntimeError(f"Failed to open video writer for {self.current_video_path}")
         
         self.recording = True
+        self._stats = {
+            'frames_captured': 0, 'frames_written': 0, 'frames_dropped': 0,
+            'grab_ms': 0.0, 'convert_ms': 0.0, 'encode_ms': 0.0,
+            'queue_depth_max': 0, 'queue_depth_total': 0,
+            'started': time.perf_counter(), 'stopped': None,
+        }
         
-        # Start recording in a separate thread
+        # Capture and encode in separate threads, so a slow encode does not
+        # stretch the capture interval; at most 8 raw frames are buffered
+        self.frame_queue = queue.Queue(maxsize=max(2, min(int(self.fps), 8)))
+        self.encode_thread = threading.Thread(target=self._encode_frames, daemon=True)
+        self.encode_thread.start()
         self.record_thread = threading.Thread(target=self._record_screen, daemon=True)
         self.record_thread.start()
         
         logger.info(f"Started video recording: {self.current_video_path}")
     
+    @staticmethod
+    def _parse_index_regions(regions) -> List[tuple]:
+        """Regions from ``x,y,w,h;x,y,w,h``, or from a list of regions."""
+        if regions is None or regions == '':
+            return []
+        if isinstance(regions, str):
+            regions = [part for part in regions.split(';') if part.strip()]
+        return [video_search.parse_region(region) for region in regions]
+    
     def _record_screen(self):
         """Internal method to capture screen frames in a loop."""
         frame_interval = 1.0 / self.fps
         
+        stats = self._stats
+        
         while self.recording:
             start_time = time.time()
             
             try:
                 # Capture screen
-                screen = ImageGrab.grab()
+                grab_start = time.perf_counter()
+                screen = self._grab_screen()
+                convert_start = time.perf_counter()
                 frame = np.array(screen)
                 # Convert RGB to BGR for OpenCV
                 frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+                convert_end = time.perf_counter()
+                stats['grab_ms'] += (convert_start - grab_start) * 1000
+                stats['convert_ms'] += (convert_end - convert_start) * 1000
+                stats['frames_captured'] += 1
                 
-                # Write frame
-                if self.video_writer is not None:
-                    self.video_writer.write(frame)
+                # Hand the frame to the encoder thread
+                try:
+                    self.frame_queue.put_nowait(frame)
+                except queue.Full:
+                    stats['frames_dropped'] += 1
+                depth = self.frame_queue.qsize()
+                stats['queue_depth_total'] += depth
+                stats['queue_depth_max'] = max(stats['queue_depth_max'], depth)
                 
             except Exception as e:
                 logger.warn(f"Error capturing frame: {e}")
@@ -129,6 +212,57 @@ class VideoRecorderLibrary:
             elapsed = time.time() - start_time
             sleep_time = max(0, frame_interval - elapsed)
             time.sleep(sleep_time)
+        
+        stats['stopped'] = time.perf_counter()
+        self.frame_queue.put(None)
+    
+    def _encode_frames(self):
+        """Internal method writing queued frames to the video file until the end marker."""
+        stats = self._stats
+        
+        while True:
+            frame = self.frame_queue.get()
+            if frame is None:
+                break
+            try:
+                encode_start = time.perf_counter()
+                if self.video_writer is not None:
+                    self.video_writer.write(frame)
+                stats['encode_ms'] += (time.perf_counter() - encode_start) * 1000
+                
+                # Index the frame so Find Frame Matching Image can seek instead of decoding
+                frame_number = stats['frames_written']
+                seconds = round(frame_number / self.fps, 3)
+                for region in [None] + self._index_regions:
+                    frame_hash = video_search.difference_hash(video_search.crop(frame, region))
+                    self._frame_index[video_search.region_key(region)].append(
+                        [frame_number, seconds, format(frame_hash, '016x')])
+                stats['frames_written'] += 1
+            except Exception as e:
+                logger.warn(f"Error encoding frame: {e}")
+    
+    def _report_metrics(self):
+        """Report capture/encode statistics of the last recording to VisualMetricsListener."""
+        stats = self._stats
+        if not METRICS.enabled or not stats:
+            return
+        
+        source = 'VideoRecorderLibrary'
+        duration = (stats['stopped'] or time.perf_counter()) - stats['started']
+        captured = stats['frames_captured']
+        METRICS.add_phase_time(source, 'grab', stats['grab_ms'])
+        METRICS.add_phase_time(source, 'convert', stats['convert_ms'])
+        METRICS.add_phase_time(source, 'encode', stats['encode_ms'])
+        METRICS.set_value(source, 'target_fps', self.fps)
+        METRICS.set_value(source, 'capture_fps', round(captured / duration, 2) if duration > 0 else 0.0)
+        METRICS.set_value(source, 'frames_captured', captured)
+        METRICS.set_value(source, 'frames_written', stats['frames_written'])
+        METRICS.set_value(source, 'frames_dropped', stats['frames_dropped'])
+        METRICS.set_value(source, 'encode_queue_depth_max', stats['queue_depth_max'])
+        METRICS.set_value(source, 'encode_queue_depth_avg',
+                          round(stats['queue_depth_total'] / captured, 2) if captured else 0.0)
+        if self.current_video_path and self.current_video_path.exists():
+            METRICS.add_bytes(source, 'video_bytes', self.current_video_path.stat().st_size)
     
     def stop_video_recording(self):
         """Stop recording and embed video in the report.
@@ -142,9 +276,11 @@ class VideoRecorderLibrary:
         
         self.recording = False
         
-        # Wait for recording thread to finish
+        # Wait for recording thread to finish, then for the encoder to drain the queue
         if self.record_thread is not None:
             self.record_thread.join(timeout=2.0)
+        if self.encode_thread is not None:
+            self.encode_thread.join(timeout=30.0)
         
         # Release video writer
         if self.video_writer is not None:
@@ -152,6 +288,12 @@ class VideoRecorderLibrary:
             self.video_writer = None
         
         logger.info(f"Stopped video recording: {self.current_video_path}")
+        dropped = self._stats['frames_dropped']
+        if dropped:
+            logger.warn(f"Video recording dropped {dropped} of {self._stats['frames_captured']} frames "
+                        f"because encoding could not keep up; try a lower fps")
+        self._report_metrics()
+        self._save_frame_index()
         
         # Embed video in report
         if self.current_video_path and self.current_video_path.exists():
@@ -160,6 +302,24 @@ class VideoRecorderLibrary:
         
         return None
     
+    def _save_frame_index(self):
+        """Store the frame hashes collected while encoding next to the video."""
+        entries = self._frame_index
+        frame_count = len(entries.get(video_search.FULL_FRAME, []))
+        if not frame_count or not self.current_video_path or not self.current_video_path.exists():
+            return
+        try:
+            if self._writer is not None:
+                index = video_search.merge_index(self.current_video_path, self.fps, self.screen_size,
+                                                 entries, frame_count=frame_count)
+                self._writer.write_json(video_search.index_path_for(self.current_video_path), index)
+            else:
+                video_search.save_index(self.current_video_path, self.fps, self.screen_size,
+                                        entries, frame_count=frame_count)
+        except OSError as e:
+            logger.warn(f"Failed to save frame index: {e}")
+        self._frame_index = {}
+    
     def _embed_video_in_report(self, video_path: Path):
         """Embed video in Robot Framework HTML report."""
         try:
@@ -201,3 +361,70 @@ class VideoRecorderLibrary:
         if self.current_video_path and self.current_video_path.exists():
             return str(self.current_video_path)
         return None
+    
+    def find_frame_matching_image(self, image: str, video: Optional[str] = None,
+                                  threshold: float = 95.0, region: Optional[str] = None,
+                                  first_only: bool = False, max_hash_distance: int = 12) -> list:
+        """Find when a recorded video shows the given image.
+        
+        Frames are prefiltered with 64-bit difference hashes; only candidates are
+        decoded and compared with the MSE similarity of ImageComparisonLibrary.
+        Videos recorded by this library carry a frame index (``<video>.frames.json``)
+        of the full frame and of the ``index_regions`` given to `Start Video Recording`,
+        so candidates are reached by seeking. Any other ``region``, and videos
+        from elsewhere, are indexed on first use, which decodes the whole video
+        once; later searches of the same region reuse that index.
+        
+        The image is compared with the whole frame, or with ``region``, so it must
+        have exactly that size: capture the baseline with the same region (e.g.
+        with `Capture Screen Region`). A small template such as an icon never
+        matches a full frame; the keyword fails on a size mismatch.
+        
+        The same search is available offline:
+        ``python libraries/video_search.py results/video/Case1.mp4 patternAfterInstall.png --region 0,0,1920,1035``
+        
+        Args:
+            image: Path to the image (baseline state) to look for, of the size
+                of the video frame or of ``region``
+            video: Path to the video (default: the last recorded video)
+            threshold: Minimum similarity percentage (0-100) for a frame to match
+            region: Frame area to compare as ``x,y,width,height`` (default: full frame)
+            first_only: Stop at the first matching frame
+            max_hash_distance: Hash prefilter tolerance in bits (0-64)
+        
+        Returns:
+            List of matching timestamps in seconds from the start of the video
+        
+        Example:
+            | ${times}= | Find Frame Matching Image | ${EXPECTED_IMAGES_DIR}/desktop_full_screen.png |
+            | ${times}= | Find Frame Matching Image | ${EXPECTED_IMAGES_DIR}/patternAfterInstall.png | ${VIDEO} | 98.0 | 0,0,1920,1035 | first_only=True |
+            | Should Not Be Empty | ${times} | Installed state never appeared |
+        """
+        if video is None:
+            video = self.get_video_path()
+            if video is None:
+                raise ValueError("No recorded video available. Pass the video path explicitly.")
+        if not Path(video).exists():
+            raise FileNotFoundError(f"Video not found: {video}")
+        if self._writer is not None:
+            # The frame index of the video may still be queued for writing
+            self._writer.wait_for(video_search.index_path_for(video))
+        
+        matches = video_search.find_matching_frames(video, image, threshold, region,
+                                                    max_hash_distance, first_only)
+        
+        if matches:
+            summary = ', '.join(f"{m['time']:.2f}s ({m['similarity']:.1f}%)" for m in matches[:20])
+            more = f" and {len(matches) - 20} more" if len(matches) > 20 else ''
+            logger.info(f"{len(matches)} frame(s) of {Path(video).name} match {os.path.basename(image)}: "
+                        f"{summary}{more}")
+        else:
+            logger.info(f"No frame of {Path(video).name} matches {os.path.basename(image)} "
+                        f"at {threshold}% similarity")
+        return [m['time'] for m in matches]
+    
+    def _close(self):
+        """Library listener: flush pending artifacts before the library instance is discarded."""
+        errors = self._writer.flush() if self._writer is not None else []
+        for error in errors:
+            logger.warn(f"Artifact could not be written: {error}")
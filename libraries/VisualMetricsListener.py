@@ -0,0 +1,124 @@
+"""
+VisualMetricsListener - Robot Framework listener exporting visual keyword metrics
+Writes per-keyword phase timings and byte counts of the visual libraries to a JSONL file
+"""
+
+import json
+from html import escape
+from pathlib import Path
+
+from robot.api import logger
+from robot.libraries.BuiltIn import BuiltIn
+
+from visual_metrics import METRICS, summarize
+
+
+class VisualMetricsListener:
+    """Listener that exports the metrics recorded by the visual libraries.
+
+    Every keyword of ImageComparisonLibrary or VideoRecorderLibrary that recorded
+    metrics produces one JSON line: the test it ran in, its name, status and
+    elapsed time, and its phase timings (``phases_ms``), byte counts (``bytes``)
+    and gauges (``values``).
+
+    Arguments:
+        output: JSONL file to write, relative to the output directory
+                (default: visual_metrics.jsonl)
+        summary: Also log a per-test summary table in log.html (default: False)
+
+    Example:
+        robot --listener libraries/VisualMetricsListener.py tests/
+        robot --listener "libraries/VisualMetricsListener.py;metrics.jsonl;True" tests/
+    """
+
+    ROBOT_LISTENER_API_VERSION = 2
+
+    def __init__(self, output: str = 'visual_metrics.jsonl', summary: str = 'False'):
+        self.output = output
+        self.summary = str(summary).strip().lower() in ('true', 'yes', 'on', '1')
+        self._file = None
+        self._test = None
+        self._rows = []
+        METRICS.enabled = True
+
+    def _open_output(self):
+        path = Path(self.output)
+        if not path.is_absolute():
+            try:
+                output_dir = BuiltIn().get_variable_value('${OUTPUT DIR}')
+            except:
+                output_dir = None
+            path = Path(output_dir or Path.cwd() / 'results') / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        logger.info(f"Writing visual keyword metrics to {path}")
+
+    def start_suite(self, name, attrs):
+        if self._file is None:
+            self._open_output()
+
+    def start_test(self, name, attrs):
+        self._test = attrs.get('longname', name)
+        self._rows = []
+        METRICS.drain()
+
+    def end_keyword(self, name, attrs):
+        events = METRICS.drain()
+        if not events:
+            return
+
+        record = {
+            'test': self._test,
+            'keyword': attrs.get('kwname', name),
+            'library': attrs.get('libname') or events[0]['library'],
+            'status': attrs.get('status'),
+            'start': attrs.get('starttime'),
+            'elapsed_ms': attrs.get('elapsedtime'),
+        }
+        record.update(summarize(events))
+        self._rows.append(record)
+
+        if self._file is not None:
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    def end_test(self, name, attrs):
+        if self.summary and self._rows:
+            logger.info(self._summary_html(self._rows), html=True)
+        self._test = None
+        self._rows = []
+
+    @staticmethod
+    def _summary_html(rows) -> str:
+        body = []
+        for row in rows:
+            phases = ', '.join(f"{k}: {v:.1f} ms" for k, v in row['phases_ms'].items())
+            sizes = ', '.join(f"{k}: {v / 1024:.1f} KB" for k, v in row['bytes'].items())
+            values = ', '.join(f"{k}: {v}" for k, v in row['values'].items())
+            body.append(f"""
+                <tr>
+                    <td style="padding: 4px 8px;">{escape(row['keyword'])}</td>
+                    <td style="padding: 4px 8px; text-align: right;">{row['elapsed_ms']}</td>
+                    <td style="padding: 4px 8px;">{escape(phases)}</td>
+                    <td style="padding: 4px 8px;">{escape(sizes)}</td>
+                    <td style="padding: 4px 8px;">{escape(values)}</td>
+                </tr>""")
+        return f"""
+        <div style="border: 2px solid #607D8B; padding: 15px; margin: 10px 0; border-radius: 5px;">
+            <h3 style="color: #607D8B; margin-top: 0;">Visual Keyword Metrics</h3>
+            <table style="border-collapse: collapse; font-size: 12px;">
+                <tr style="background-color: #eceff1;">
+                    <th style="padding: 4px 8px;">Keyword</th>
+                    <th style="padding: 4px 8px;">Elapsed (ms)</th>
+                    <th style="padding: 4px 8px;">Phases</th>
+                    <th style="padding: 4px 8px;">Bytes</th>
+                    <th style="padding: 4px 8px;">Values</th>
+                </tr>{''.join(body)}
+            </table>
+        </div>
+        """
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
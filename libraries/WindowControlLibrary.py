@@ -2,25 +2,40 @@
 Window Control Library for Robot Framework
 Provides keywords to control Windows window states (minimize, maximize, restore)
 """
-import ctypes
-import time
-from ctypes import wintypes
+from window_backends import get_window_backend
 
 
 class WindowControlLibrary:
-    """Library for controlling Windows window states"""
+    """Library for controlling Windows window states
     
-    ROBOT_LIBRARY_SCOPE = 'GLOBAL'
+    Window access goes through a pluggable backend: ``auto`` (the Win32 API)
+    by default, ``fake`` for an in-memory desktop on machines without a
+    Windows desktop, or the dotted path of a custom
+    ``window_backends.WindowBackend`` class.
+    """
     
-    # Windows API constants
-    SW_MINIMIZE = 6
-    SW_MAXIMIZE = 3
-    SW_RESTORE = 9
-    SW_SHOW = 5
+    ROBOT_LIBRARY_SCOPE = 'GLOBAL'
     
-    def __init__(self):
-        self.user32 = ctypes.windll.user32
+    def __init__(self, backend: str = 'auto'):
+        """Import the library.
         
+        Args:
+            backend: Window backend, 'auto', 'win32', 'fake' or a dotted class path
+            
+        Examples:
+        | Library | WindowControlLibrary.py |
+        | Library | WindowControlLibrary.py | backend=fake |
+        """
+        self._backend_name = backend
+        self._backend = None
+    
+    @property
+    def backend(self):
+        """Window backend, created on first keyword use so the library imports on any platform"""
+        if self._backend is None:
+            self._backend = get_window_backend(self._backend_name)
+        return self._backend
+    
     def minimize_window_by_title(self, title_substring):
         """
         Minimize a window that contains the specified text in its title.
@@ -34,7 +49,7 @@ class WindowControlLibrary:
         """
         hwnd = self._find_window_by_title(title_substring)
         if hwnd:
-            self.user32.ShowWindow(hwnd, self.SW_MINIMIZE)
+            self.backend.show_window(hwnd, 'minimize')
             return True
         else:
             raise Exception(f"Window with title containing '{title_substring}' not found")
@@ -51,7 +66,7 @@ class WindowControlLibrary:
         """
         hwnd = self._find_window_by_title(title_substring)
         if hwnd:
-            self.user32.ShowWindow(hwnd, self.SW_MAXIMIZE)
+            self.backend.show_window(hwnd, 'maximize')
             return True
         else:
             raise Exception(f"Window with title containing '{title_substring}' not found")
@@ -68,8 +83,8 @@ class WindowControlLibrary:
         """
         hwnd = self._find_window_by_title(title_substring)
         if hwnd:
-            self.user32.ShowWindow(hwnd, self.SW_RESTORE)
-            self.user32.SetForegroundWindow(hwnd)
+            self.backend.show_window(hwnd, 'restore')
+            self.backend.set_foreground(hwnd)
             return True
         else:
             raise Exception(f"Window with title containing '{title_substring}' not found")
@@ -88,7 +103,7 @@ class WindowControlLibrary:
             try:
                 hwnd = self._find_window_by_title(browser)
                 if hwnd:
-                    self.user32.ShowWindow(hwnd, self.SW_MINIMIZE)
+                    self.backend.show_window(hwnd, 'minimize')
                     minimized.append(browser)
             except:
                 pass
@@ -111,39 +126,39 @@ class WindowControlLibrary:
         """
         hwnd = self._find_window_by_title(title_substring)
         if hwnd:
-            length = self.user32.GetWindowTextLengthW(hwnd)
-            buff = ctypes.create_unicode_buffer(length + 1)
-            self.user32.GetWindowTextW(hwnd, buff, length + 1)
-            return buff.value
+            return self.backend.get_title(hwnd)
         else:
             raise Exception(f"Window with title containing '{title_substring}' not found")
     
-    def _find_window_by_title(self, title_substring):
-        """Find window handle by partial title match"""
-        found_hwnd = [None]
-        
-        def enum_windows_callback(hwnd, lparam):
-            if self.user32.IsWindowVisible(hwnd):
-                length = self.user32.GetWindowTextLengthW(hwnd)
-                if length > 0:
-                    buff = ctypes.create_unicode_buffer(length + 1)
-                    self.user32.GetWindowTextW(hwnd, buff, length + 1)
-                    if title_substring.lower() in buff.value.lower():
-                        found_hwnd[0] = hwnd
-                        return False  # Stop enumeration
-            return True  # Continue enumeration
-        
-        # Define callback type
-        EnumWindowsProc = ctypes.WINFUNCTYPE(
-            wintypes.BOOL,
-            wintypes.HWND,
-            wintypes.LPARAM
-        )
+    def get_window_rect(self, title_substring):
+        """
+        Get the position and size of a window containing the specified text.
         
-        # Enumerate windows
-        self.user32.EnumWindows(EnumWindowsProc(enum_windows_callback), 0)
+        The rectangle is the visible window frame in screen coordinates (without
+        the invisible resize borders), in the same pixels `Capture Screen Region`
+        uses.
         
-        return found_hwnd[0]
+        Arguments:
+            title_substring: Part of the window title to search for
+            
+        Returns:
+            List of x, y, width, height
+            
+        Example:
+            | ${rect}= | Get Window Rect | AgileMark |
+            | Capture Screen Region | @{rect} |
+        """
+        hwnd = self._find_window_by_title(title_substring)
+        if hwnd:
+            if self.backend.is_minimized(hwnd):
+                raise Exception(f"Window '{self.backend.get_title(hwnd)}' is minimized")
+            return list(self.backend.get_rect(hwnd))
+        else:
+            raise Exception(f"Window with title containing '{title_substring}' not found")
+    
+    def _find_window_by_title(self, title_substring):
+        """Find window handle by partial title match"""
+        return self.backend.find_window(title_substring)
     
     def list_all_windows(self):
         """
@@ -156,24 +171,4 @@ class WindowControlLibrary:
             | ${windows}= | List All Windows |
             | Log List | ${windows} |
         """
-        windows = []
-        
-        def enum_windows_callback(hwnd, lparam):
-            if self.user32.IsWindowVisible(hwnd):
-                length = self.user32.GetWindowTextLengthW(hwnd)
-                if length > 0:
-                    buff = ctypes.create_unicode_buffer(length + 1)
-                    self.user32.GetWindowTextW(hwnd, buff, length + 1)
-                    if buff.value.strip():
-                        windows.append(buff.value)
-            return True
-        
-        EnumWindowsProc = ctypes.WINFUNCTYPE(
-            wintypes.BOOL,
-            wintypes.HWND,
-            wintypes.LPARAM
-        )
-        
-        self.user32.EnumWindows(EnumWindowsProc(enum_windows_callback), 0)
-        
-        return windows
+        return [title for _, title in self.backend.list_windows() if title.strip()]
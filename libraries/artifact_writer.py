@@ -0,0 +1,180 @@
+"""
+artifact_writer - Background PNG/JSON writer shared by the visual libraries
+Moves artifact encoding and file I/O off the keyword's thread, with bounded memory and a flush barrier
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+from lazy_imports import LazyModule
+
+cv2 = LazyModule('cv2', 'opencv-python')
+np = LazyModule('numpy', 'numpy')
+
+
+DEFAULT_WORKERS = 2
+# Artifacts accepted but not yet written; further submissions wait for a slot
+DEFAULT_MAX_PENDING = 8
+
+
+def encode_png(image: np.ndarray, compression: Optional[int] = None) -> bytes:
+    """PNG-encode a BGR/grayscale array; ``compression`` 0-9, None for the OpenCV default."""
+    params = [] if compression is None else [cv2.IMWRITE_PNG_COMPRESSION, int(compression)]
+    ok, buffer = cv2.imencode('.png', image, params)
+    if not ok:
+        raise ValueError("PNG encoding failed")
+    return buffer.tobytes()
+
+
+def write_file_atomic(path: Union[str, Path], data: bytes):
+    """Write ``data`` to a temporary file next to ``path`` and move it in place."""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ArtifactWriter:
+    """Encodes and writes artifacts on a small thread pool.
+
+    ``write_png`` takes ownership of the array it is given: nothing is copied,
+    so the caller must not modify the array afterwards (the libraries only hand
+    over arrays they created for the artifact). At most ``max_pending``
+    artifacts are held at a time; once that many are waiting, the next
+    submission blocks until one is written, which bounds the memory held by
+    a burst of comparisons.
+
+    Files appear atomically (written to a temporary name, then renamed), so a
+    reader never sees a partial PNG. ``wait_for`` waits for one pending path,
+    ``flush`` for all of them.
+
+    Args:
+        workers: Encoder/writer threads
+        max_pending: Artifacts accepted but not yet written
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='artifact_writer')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+        self._errors: List[str] = []
+
+    def write(self, path: Union[str, Path], encode: Callable[[], bytes],
+              on_written: Optional[Callable[[str, int], None]] = None) -> Future:
+        """Queue a write of the bytes ``encode()`` returns, running ``encode`` on a worker.
+
+        Args:
+            path: Destination file
+            encode: Produces the file content; everything it refers to is owned
+                by the writer until the write is done
+            on_written: Called with the path and byte count once the file is written
+        """
+        key = os.path.abspath(str(path))
+        self._slots.acquire()
+        with self._lock:
+            previous = self._pending.get(key)
+
+        def run():
+            try:
+                data = encode()
+                if previous is not None:
+                    # Same file queued twice: the later artifact must win
+                    previous.exception()
+                write_file_atomic(key, data)
+                if on_written is not None:
+                    on_written(key, len(data))
+            except Exception as e:
+                with self._lock:
+                    self._errors.append(f"{key}: {e}")
+                raise
+            finally:
+                self._slots.release()
+
+        try:
+            future = self._executor.submit(run)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key: str, future: Future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def write_png(self, path: Union[str, Path], image: np.ndarray, compression: Optional[int] = None,
+                  on_written: Optional[Callable[[str, int], None]] = None) -> Future:
+        """Queue ``image`` to be PNG-encoded and written to ``path``.
+
+        Args:
+            path: Destination file
+            image: Array to write; owned by the writer from now on
+            compression: PNG compression level 0-9 (None: OpenCV default)
+            on_written: Called with the path and byte count once the file is written
+        """
+        return self.write(path, lambda: encode_png(image, compression), on_written)
+
+    def write_json(self, path: Union[str, Path], document,
+                   on_written: Optional[Callable[[str, int], None]] = None) -> Future:
+        """Queue ``document`` to be serialized and written; serialized in the worker, so do not modify it."""
+        return self.write(path, lambda: json.dumps(document).encode('utf-8'), on_written)
+
+    def wait_for(self, path: Union[str, Path], timeout: Optional[float] = None):
+        """Block until a pending write to ``path`` (if any) has finished."""
+        with self._lock:
+            future = self._pending.get(os.path.abspath(str(path)))
+        if future is not None:
+            future.exception(timeout)
+
+    def flush(self, timeout: Optional[float] = None) -> List[str]:
+        """Wait until every queued artifact is written.
+
+        Returns:
+            Errors (``"<path>: <message>"``) of writes that failed since the last flush
+        """
+        with self._lock:
+            futures = list(self._pending.values())
+        for future in futures:
+            future.exception(timeout)
+        with self._lock:
+            errors, self._errors = self._errors, []
+        return errors
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+
+_writer: Optional[ArtifactWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_artifact_writer() -> ArtifactWriter:
+    """Return the writer shared by all libraries in this process, creating it on first use.
+
+    It is flushed and shut down when the interpreter exits, so artifacts queued
+    by the last keyword are never lost.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ArtifactWriter()
+            atexit.register(_writer.close)
+        return _writer
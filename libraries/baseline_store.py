@@ -0,0 +1,227 @@
+"""
+baseline_store - Precompiled baseline images for ImageComparisonLibrary
+Converts baseline PNGs into raw .npy arrays that can be memory-mapped without decoding
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from lazy_imports import LazyModule
+
+cv2 = LazyModule('cv2', 'opencv-python')
+np = LazyModule('numpy', 'numpy')
+
+
+COMPILED_DIR_NAME = '.compiled'
+INDEX_FILE_NAME = 'index.json'
+INDEX_VERSION = 1
+BASELINE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+REPLACE_ATTEMPTS = 5
+
+
+class BaselineStore:
+    """Compiles baseline images into memory-mappable arrays and loads them back.
+
+    Every directory holding baselines gets a ``.compiled`` subdirectory with one
+    ``.npy`` file per image plus an ``index.json`` header index. The index records
+    the source file's size and modification time, so a compiled copy is only used
+    while it is still in sync with its PNG.
+
+    Compiled arrays are opened with ``mmap_mode='r'``: loading costs a page-table
+    mapping instead of a PNG decode, and parallel workers on one machine share the
+    same pages through the OS page cache.
+
+    Because workers may hold a compiled file mapped, a file is never rewritten in
+    place: every compile writes a new versioned file and switches the index to
+    it. Superseded files are deleted once nothing maps them any more; Windows
+    refuses to delete a mapped file, so those are retried on the next compile.
+    """
+
+    def __init__(self):
+        self._indexes = {}
+
+    @staticmethod
+    def _compiled_dir(image_dir: Path) -> Path:
+        return image_dir / COMPILED_DIR_NAME
+
+    @staticmethod
+    def _source_signature(image_path: Path) -> Dict[str, int]:
+        stat = image_path.stat()
+        return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    def _read_index(self, compiled_dir: Path) -> Dict[str, dict]:
+        """Read (and cache) the index of a compiled directory."""
+        index_path = compiled_dir / INDEX_FILE_NAME
+        try:
+            index_mtime = index_path.stat().st_mtime_ns
+        except OSError:
+            self._indexes.pop(compiled_dir, None)
+            return {}
+
+        cached = self._indexes.get(compiled_dir)
+        if cached is not None and cached[0] == index_mtime:
+            return cached[1]
+
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if index.get('version') != INDEX_VERSION:
+            return {}
+
+        entries = index.get('entries', {})
+        self._indexes[compiled_dir] = (index_mtime, entries)
+        return entries
+
+    @staticmethod
+    def _write_atomic(path: Path, writer):
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            writer(tmp_path)
+            for attempt in range(REPLACE_ATTEMPTS):
+                try:
+                    os.replace(tmp_path, path)
+                    break
+                except PermissionError:
+                    # Windows: a worker is reading the index right now
+                    if attempt == REPLACE_ATTEMPTS - 1:
+                        raise
+                    time.sleep(0.05)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    @staticmethod
+    def _save_array(path: Path, array: np.ndarray):
+        with open(path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array))
+
+    def compile_directory(self, directory: Union[str, Path], force: bool = False) -> Dict[str, int]:
+        """Compile every baseline image below ``directory``.
+
+        Args:
+            directory: Baseline directory, searched recursively
+            force: Recompile images even if their compiled copy is up to date
+
+        Returns:
+            Counts of ``compiled``, ``skipped`` (already fresh) and ``failed`` images
+        """
+        root = Path(directory)
+        if not root.is_dir():
+            raise ValueError(f"Baseline directory does not exist: {directory}")
+
+        images_by_dir = {}
+        for image_path in sorted(root.rglob('*')):
+            if COMPILED_DIR_NAME in image_path.parts:
+                continue
+            if image_path.is_file() and image_path.suffix.lower() in BASELINE_EXTENSIONS:
+                images_by_dir.setdefault(image_path.parent, []).append(image_path)
+
+        stats = {'compiled': 0, 'skipped': 0, 'failed': 0}
+        for image_dir, image_paths in images_by_dir.items():
+            compiled_dir = self._compiled_dir(image_dir)
+            compiled_dir.mkdir(exist_ok=True)
+            old_entries = self._read_index(compiled_dir)
+            entries = {}
+
+            for image_path in image_paths:
+                signature = self._source_signature(image_path)
+                old_entry = old_entries.get(image_path.name)
+                if (not force and old_entry is not None
+                        and old_entry.get('mtime_ns') == signature['mtime_ns']
+                        and old_entry.get('size') == signature['size']
+                        and (compiled_dir / old_entry['npy']).exists()):
+                    entries[image_path.name] = old_entry
+                    stats['skipped'] += 1
+                    continue
+
+                img = cv2.imread(str(image_path))
+                if img is None:
+                    stats['failed'] += 1
+                    continue
+
+                npy_name = f"{image_path.name}.{time.time_ns():x}.npy"
+                self._write_atomic(compiled_dir / npy_name, lambda p: self._save_array(p, img))
+                entries[image_path.name] = {
+                    'npy': npy_name,
+                    'mtime_ns': signature['mtime_ns'],
+                    'size': signature['size'],
+                    'shape': list(img.shape),
+                    'dtype': str(img.dtype),
+                }
+                stats['compiled'] += 1
+
+            # Drop superseded compiled files and those whose source image is gone
+            live_files = {entry['npy'] for entry in entries.values()}
+            for npy_path in compiled_dir.glob('*.npy'):
+                if npy_path.name not in live_files:
+                    try:
+                        npy_path.unlink()
+                    except PermissionError:
+                        # Still mapped by a worker (Windows); the next compile retries
+                        pass
+
+            index = {'version': INDEX_VERSION, 'entries': entries}
+            self._write_atomic(compiled_dir / INDEX_FILE_NAME,
+                               lambda p: p.write_text(json.dumps(index, indent=2), encoding='utf-8'))
+            self._indexes.pop(compiled_dir, None)
+
+        return stats
+
+    def load(self, image_path: Union[str, Path]) -> Optional[np.ndarray]:
+        """Memory-map the compiled copy of ``image_path``.
+
+        Returns:
+            A read-only BGR array, or None if there is no compiled copy or it is
+            stale, in which case the caller should decode the image itself.
+        """
+        image_path = Path(image_path)
+        entries = self._read_index(self._compiled_dir(image_path.parent))
+        entry = entries.get(image_path.name)
+        if entry is None:
+            return None
+
+        try:
+            signature = self._source_signature(image_path)
+        except OSError:
+            return None
+        if entry.get('mtime_ns') != signature['mtime_ns'] or entry.get('size') != signature['size']:
+            return None
+
+        try:
+            array = np.load(self._compiled_dir(image_path.parent) / entry['npy'], mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if list(array.shape) != entry.get('shape'):
+            return None
+        return array
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Precompile baseline images into memory-mappable .npy files.")
+    parser.add_argument('directories', nargs='+', help="Baseline directories to compile")
+    parser.add_argument('--force', action='store_true', help="Recompile up-to-date images too")
+    args = parser.parse_args(argv)
+
+    store = BaselineStore()
+    exit_code = 0
+    for directory in args.directories:
+        stats = store.compile_directory(directory, force=args.force)
+        print(f"{directory}: {stats['compiled']} compiled, {stats['skipped']} up to date, "
+              f"{stats['failed']} failed")
+        if stats['failed']:
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+diff_patches - Compact difference output for ImageComparisonLibrary
+Groups changed pixels into regions and renders small zoomed expected/actual/diff patches per region
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+from lazy_imports import LazyModule
+
+cv2 = LazyModule('cv2', 'opencv-python')
+np = LazyModule('numpy', 'numpy')
+
+from image_metrics import mse_to_similarity
+
+
+# Changed pixels closer than this are merged into one region
+MERGE_DISTANCE = 16
+# Regions with fewer changed pixels are treated as noise
+MIN_DIFF_PIXELS = 6
+# Most regions reported; the smallest ones beyond that are only counted
+MAX_REGIONS = 12
+# Context around each region, in pixels
+PATCH_PADDING = 6
+# Patches are zoomed (nearest neighbour, at most MAX_ZOOM) towards this size
+PATCH_TARGET_SIZE = 160
+MAX_ZOOM = 8
+# Larger regions are shrunk to this size instead
+MAX_PATCH_SIZE = 480
+OVERVIEW_WIDTH = 640
+
+Box = Tuple[int, int, int, int]
+
+
+def find_regions(diff_gray: np.ndarray, merge_distance: int = MERGE_DISTANCE,
+                 min_pixels: int = MIN_DIFF_PIXELS) -> List[Box]:
+    """Bounding boxes ``(x, y, width, height)`` of groups of changed pixels, largest first.
+
+    Changed pixels within ``merge_distance`` of each other end up in the same
+    box, so a changed icon or a line of text is one region, not dozens.
+    """
+    mask = (diff_gray > 0).astype(np.uint8)
+    if merge_distance > 1:
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (merge_distance, merge_distance))
+        grouped = cv2.dilate(mask, kernel)
+    else:
+        grouped = mask
+    contours, _ = cv2.findContours(grouped, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        # Shrink the dilated box back to the changed pixels it holds
+        inner = mask[y:y + h, x:x + w]
+        if int(inner.sum()) < min_pixels:
+            continue
+        ix, iy, iw, ih = cv2.boundingRect(inner)
+        regions.append((x + ix, y + iy, iw, ih))
+    regions.sort(key=lambda box: box[2] * box[3], reverse=True)
+    return regions
+
+
+def _pad(box: Box, shape, padding: int) -> Box:
+    x, y, w, h = box
+    x0, y0 = max(0, x - padding), max(0, y - padding)
+    x1, y1 = min(shape[1], x + w + padding), min(shape[0], y + h + padding)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _zoom(w: int, h: int) -> float:
+    longest = max(w, h)
+    if longest > MAX_PATCH_SIZE:
+        return MAX_PATCH_SIZE / longest
+    return float(max(1, min(MAX_ZOOM, PATCH_TARGET_SIZE // longest)))
+
+
+def render_patch(expected: np.ndarray, actual: np.ndarray, diff_gray: np.ndarray, box: Box) -> np.ndarray:
+    """Render expected | actual | difference heatmap of one region, zoomed."""
+    x, y, w, h = box
+    zoom = _zoom(w, h)
+    size = (max(1, round(w * zoom)), max(1, round(h * zoom)))
+    interpolation = cv2.INTER_NEAREST if zoom >= 1 else cv2.INTER_AREA
+
+    panels = [
+        expected[y:y + h, x:x + w],
+        actual[y:y + h, x:x + w],
+        cv2.applyColorMap(diff_gray[y:y + h, x:x + w], cv2.COLORMAP_JET),
+    ]
+    gap = np.full((size[1], 4, 3), 255, dtype=np.uint8)
+    row = []
+    for panel in panels:
+        if row:
+            row.append(gap)
+        row.append(cv2.resize(panel, size, interpolation=interpolation))
+    return np.hstack(row)
+
+
+def render_overview(actual: np.ndarray, regions: List[Box]) -> np.ndarray:
+    """Downscaled actual image with the numbered regions outlined."""
+    scale = min(1.0, OVERVIEW_WIDTH / actual.shape[1])
+    overview = cv2.resize(actual, (max(1, round(actual.shape[1] * scale)), max(1, round(actual.shape[0] * scale))),
+                          interpolation=cv2.INTER_AREA)
+    for number, (x, y, w, h) in enumerate(regions, 1):
+        top_left = (int(x * scale), int(y * scale))
+        bottom_right = (int((x + w) * scale) + 1, int((y + h) * scale) + 1)
+        cv2.rectangle(overview, top_left, bottom_right, (255, 0, 255), 2)
+        cv2.putText(overview, str(number), (top_left[0], max(12, top_left[1] - 3)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 0, 255), 1)
+    return overview
+
+
+def diff_regions(expected: np.ndarray, actual: np.ndarray, max_regions: int = MAX_REGIONS) -> Dict:
+    """Find the changed regions of two equally sized images and score each one.
+
+    Returns:
+        Dict with ``diff_gray``, ``diff_pixels``, ``regions`` (dicts with ``box``
+        as ``[x, y, width, height]``, ``patch_box`` including the context padding,
+        ``diff_pixels``, ``max_diff`` and ``similarity``) and ``omitted``, the
+        number of smaller regions left out beyond ``max_regions``
+    """
+    diff_gray = cv2.cvtColor(cv2.absdiff(expected, actual), cv2.COLOR_BGR2GRAY)
+    boxes = find_regions(diff_gray)
+
+    regions = []
+    for box in boxes[:max_regions]:
+        x, y, w, h = box
+        diff = diff_gray[y:y + h, x:x + w]
+        error = expected[y:y + h, x:x + w].astype(np.float32) - actual[y:y + h, x:x + w].astype(np.float32)
+        regions.append({
+            'box': list(box),
+            'patch_box': list(_pad(box, diff_gray.shape, PATCH_PADDING)),
+            'diff_pixels': int(np.count_nonzero(diff)),
+            'max_diff': int(diff.max()),
+            'similarity': round(mse_to_similarity(float(np.mean(np.square(error)))), 3),
+        })
+
+    return {
+        'diff_gray': diff_gray,
+        'diff_pixels': int(np.count_nonzero(diff_gray)),
+        'regions': regions,
+        'omitted': max(0, len(boxes) - max_regions),
+    }
@@ -0,0 +1,52 @@
+"""
+lazy_imports - Deferred imports of heavy dependencies for the visual libraries
+Keeps library import (robot --dryrun, libdoc, pabot worker start) free of cv2, numpy and PIL
+"""
+
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Module placeholder that imports the real module on first attribute access.
+
+    After the import the real module's namespace is copied onto the
+    placeholder, so later attribute lookups are plain dictionary hits and cost
+    the same as on the real module.
+
+    A missing dependency raises the same ``ImportError`` the libraries raised at
+    import time before, only at first use.
+
+    Args:
+        name: Module to import, e.g. ``'cv2'`` or ``'PIL.ImageGrab'``
+        package: Distribution to suggest installing when the import fails
+    """
+
+    def __init__(self, name: str, package: str):
+        super().__init__(name)
+        self.__dict__['_lazy_package'] = package
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            try:
+                module = importlib.import_module(self.__name__)
+            except ImportError as e:
+                raise ImportError(f"Required libraries not installed: {e}. "
+                                  f"Please install {self.__dict__['_lazy_package']}.") from e
+            self.__dict__.update(module.__dict__)
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        # Only called for attributes not copied over yet, i.e. before the first load
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self.__dict__['_lazy_module'] is not None else 'not loaded'
+        return f"<lazy module '{self.__name__}' ({state})>"
+
@@ -0,0 +1,268 @@
+"""
+screen_watcher - One capture loop watching the screen for several templates at once
+Backs the Wait For Any Of keyword of ImageComparisonLibrary
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from lazy_imports import LazyModule
+
+cv2 = LazyModule('cv2', 'opencv-python')
+np = LazyModule('numpy', 'numpy')
+
+from incremental_evaluator import Box, TileDiffEvaluator
+
+
+Region = Tuple[int, int, int, int]
+
+# Templates are located on a downscaled frame first: (minimum template side, scale)
+COARSE_SCALES = ((64, 4), (16, 2))
+# How much lower the coarse score may be than the final threshold (or than the
+# template's own worst coarse score); covers backgrounds bleeding in at the edges
+COARSE_SLACK = 0.25
+# Above this share of changed tiles a full (coarse-to-fine) check is cheaper than an incremental one
+INCREMENTAL_MAX_FRACTION = 0.25
+
+
+def downscale(gray: np.ndarray, scale: int) -> np.ndarray:
+    """Gaussian pyramid level of ``gray``; smoothing keeps unaligned matches high."""
+    while scale > 1:
+        gray = cv2.pyrDown(gray)
+        scale //= 2
+    return gray
+
+
+class WatchTarget:
+    """A template to look for, optionally restricted to a screen region.
+
+    ``similarity`` is the minimum normalized correlation (``TM_CCOEFF_NORMED``)
+    on a 0-1 scale, not a percentage.
+    """
+
+    def __init__(self, name: str, template: np.ndarray, region: Optional[Region] = None,
+                 similarity: float = 0.9):
+        self.name = name
+        self.region = region
+        self.similarity = similarity
+        self.gray = template if template.ndim == 2 else cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+        self.height, self.width = self.gray.shape[:2]
+        self.scale = next((scale for size, scale in COARSE_SCALES if min(self.height, self.width) >= size), 1)
+        self.coarse = downscale(self.gray, self.scale) if self.scale > 1 else None
+        # Coarse scores below this rule the target out for the tick
+        self.coarse_threshold = (min(self.similarity, self._coarse_floor()) - COARSE_SLACK
+                                 if self.coarse is not None else None)
+
+    def _coarse_floor(self) -> float:
+        """Lowest coarse score of the template against itself over all pixel grid offsets.
+
+        Fine detail (text, noise) can average away at 1/2 or 1/4 scale, so such a
+        template scores low at the coarse level even where it is on screen; the
+        rejection threshold is lowered to match. The template is embedded in
+        noise, the worst background for the smoothing at its edges.
+        """
+        scale, pad = self.scale, 2 * self.scale
+        background = np.random.default_rng(0).integers(
+            0, 256, size=(self.height + 2 * pad + scale, self.width + 2 * pad + scale), dtype=np.uint8)
+        floor = 1.0
+        for dy in range(scale):
+            for dx in range(scale):
+                canvas = background.copy()
+                canvas[pad + dy:pad + dy + self.height, pad + dx:pad + dx + self.width] = self.gray
+                result = cv2.matchTemplate(downscale(canvas, scale), self.coarse, cv2.TM_CCOEFF_NORMED)
+                floor = min(floor, cv2.minMaxLoc(result)[1])
+        return floor
+
+
+class ScreenWatcher:
+    """Checks every registered target against a single capture per tick.
+
+    Each tick grabs the bounding box of all target regions once, converts it to
+    grayscale (and to each downscaled size in use) once, and matches every
+    target against that shared frame. Templates of 16 pixels and up are located
+    on a 1/2 or 1/4 scale Gaussian pyramid level first and only verified at full
+    resolution around the best coarse position, and targets whose coarse score
+    is far below their threshold are rejected there. The cost of a tick is
+    dominated by the capture, not by the number of targets.
+
+    While waiting, the frames are also tracked per tile (see
+    ``incremental_evaluator``), and later ticks only search where the screen
+    changed since the previous capture. A target that was only ruled out at
+    the coarse level is searched once more at full resolution on the next
+    tick, since the coarse level can miss a match on the unchanged tiles.
+
+    Args:
+        grab: Callable taking a region ``(x, y, width, height)`` or None for the
+              full screen, and returning that area as a BGR array
+    """
+
+    def __init__(self, grab: Callable[[Optional[Region]], np.ndarray]):
+        self.grab = grab
+        self.targets: List[WatchTarget] = []
+        # Targets the last full check ruled out at the coarse level only
+        self._coarse_rejected: Set[WatchTarget] = set()
+
+    def add_target(self, name: str, template: np.ndarray, region: Optional[Region] = None,
+                   similarity: float = 0.9) -> WatchTarget:
+        if any(t.name == name for t in self.targets):
+            raise ValueError(f"Target names must be unique, '{name}' is used twice")
+        target = WatchTarget(name, template, region, similarity)
+        self.targets.append(target)
+        return target
+
+    def _capture_area(self) -> Optional[Region]:
+        """Bounding box of all target regions, or None if any target watches the full screen."""
+        if not self.targets or any(t.region is None for t in self.targets):
+            return None
+        left = min(t.region[0] for t in self.targets)
+        top = min(t.region[1] for t in self.targets)
+        right = max(t.region[0] + t.region[2] for t in self.targets)
+        bottom = max(t.region[1] + t.region[3] for t in self.targets)
+        return left, top, right - left, bottom - top
+
+    @staticmethod
+    def _best_match(search: np.ndarray, template: np.ndarray) -> Tuple[float, Tuple[int, int]]:
+        if search.shape[0] < template.shape[0] or search.shape[1] < template.shape[1]:
+            return -1.0, (0, 0)
+        result = cv2.matchTemplate(search, template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, location = cv2.minMaxLoc(result)
+        return score, location
+
+    @staticmethod
+    def _search_bounds(target: WatchTarget, gray: np.ndarray, origin: Tuple[int, int]) -> Box:
+        """Search area of ``target``, relative to the captured frame."""
+        if target.region is None:
+            return 0, 0, gray.shape[1], gray.shape[0]
+        x0, y0 = target.region[0] - origin[0], target.region[1] - origin[1]
+        return x0, y0, x0 + target.region[2], y0 + target.region[3]
+
+    @staticmethod
+    def _match_result(target: WatchTarget, score: float, location: Tuple[int, int],
+                      origin: Tuple[int, int]) -> Optional[Dict]:
+        if score < target.similarity:
+            return None
+        # Positions may come from NumPy arithmetic; keep the result plain Python
+        return {
+            'name': target.name,
+            'x': int(origin[0] + location[0]),
+            'y': int(origin[1] + location[1]),
+            'width': target.width,
+            'height': target.height,
+            'score': round(float(score), 4),
+        }
+
+    def _match_target(self, target: WatchTarget, gray: np.ndarray, scaled: Dict[int, np.ndarray],
+                      origin: Tuple[int, int]) -> Optional[Dict]:
+        x0, y0, x1, y1 = self._search_bounds(target, gray, origin)
+
+        score = -1.0
+        if target.coarse is not None:
+            scale = target.scale
+            if scale not in scaled:
+                scaled[scale] = downscale(gray, scale)
+            coarse = scaled[scale][y0 // scale:-(-y1 // scale), x0 // scale:-(-x1 // scale)]
+            score, (cx, cy) = self._best_match(coarse, target.coarse)
+            if score < target.coarse_threshold:
+                self._coarse_rejected.add(target)
+                return None
+            # Verify at full resolution in a small window around the coarse hit
+            margin = 2 * scale
+            vx0 = max(x0, (x0 // scale + cx) * scale - margin)
+            vy0 = max(y0, (y0 // scale + cy) * scale - margin)
+            vx1 = min(x1, vx0 + target.width + 2 * margin)
+            vy1 = min(y1, vy0 + target.height + 2 * margin)
+            score, (mx, my) = self._best_match(gray[vy0:vy1, vx0:vx1], target.gray)
+            mx, my = mx + vx0, my + vy0
+
+        if score < target.similarity:
+            # Small template, or the coarse hit was not the real one: search at full resolution
+            return self._match_full(target, gray, origin)
+        return self._match_result(target, score, (mx, my), origin)
+
+    def _match_full(self, target: WatchTarget, gray: np.ndarray, origin: Tuple[int, int]) -> Optional[Dict]:
+        """Search every position of ``target`` at full resolution."""
+        x0, y0, x1, y1 = self._search_bounds(target, gray, origin)
+        score, (mx, my) = self._best_match(gray[y0:y1, x0:x1], target.gray)
+        return self._match_result(target, score, (mx + x0, my + y0), origin)
+
+    def _match_changed(self, target: WatchTarget, gray: np.ndarray, tiles: TileDiffEvaluator,
+                       origin: Tuple[int, int]) -> Optional[Dict]:
+        """Search only the template positions that overlap a changed tile."""
+        x0, y0, x1, y1 = self._search_bounds(target, gray, origin)
+        best_score, best_location = -1.0, (0, 0)
+        for bx0, by0, bx1, by1 in tiles.changed_boxes((target.width - 1, target.height - 1)):
+            # Positions start inside the box; the template may extend past its end
+            sx0, sy0 = max(x0, bx0), max(y0, by0)
+            sx1, sy1 = min(x1, bx1 + target.width - 1), min(y1, by1 + target.height - 1)
+            score, (mx, my) = self._best_match(gray[sy0:sy1, sx0:sx1], target.gray)
+            if score > best_score:
+                best_score, best_location = score, (mx + sx0, my + sy0)
+        return self._match_result(target, best_score, best_location, origin)
+
+    def check(self, frame: np.ndarray, origin: Tuple[int, int] = (0, 0),
+              targets: Optional[Sequence[WatchTarget]] = None,
+              tiles: Optional[TileDiffEvaluator] = None) -> Optional[Dict]:
+        """Match targets against one captured frame; return the first match or None.
+
+        With ``tiles``, the frame is fed to that evaluator first. If it has seen
+        earlier frames of the same area - all of which had no match - only the
+        positions overlapping changed tiles can hold a new match, so only those
+        are searched, and an unchanged frame costs nothing but the tile comparison.
+        Targets the previous full check rejected at the coarse level only are
+        the exception: they are searched once at full resolution everywhere.
+        """
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        targets = self.targets if targets is None else targets
+
+        if tiles is not None:
+            incremental = tiles.frame is not None
+            changed = tiles.update(gray)
+            if incremental and changed <= tiles.changed.size * INCREMENTAL_MAX_FRACTION:
+                for target in targets:
+                    if target in self._coarse_rejected:
+                        self._coarse_rejected.discard(target)
+                        match = self._match_full(target, gray, origin)
+                    elif changed:
+                        match = self._match_changed(target, gray, tiles, origin)
+                    else:
+                        match = None
+                    if match is not None:
+                        return match
+                return None
+
+        # Downscaled frames are built on first use and shared by all targets of the tick
+        scaled = {}
+        self._coarse_rejected.clear()
+        for target in targets:
+            match = self._match_target(target, gray, scaled, origin)
+            if match is not None:
+                return match
+        return None
+
+    def wait(self, timeout: float = 10.0, interval: float = 0.25) -> Optional[Dict]:
+        """Poll until a target appears or ``timeout`` seconds pass.
+
+        After the first tick only what changed on screen is searched again.
+
+        Returns:
+            The first match with ``latency`` (seconds) and ``ticks`` added, or None
+        """
+        area = self._capture_area()
+        origin = (area[0], area[1]) if area else (0, 0)
+        tiles = TileDiffEvaluator()
+        start = time.monotonic()
+        ticks = 0
+        while True:
+            tick_start = time.monotonic()
+            frame = self.grab(area)
+            ticks += 1
+            match = self.check(frame, origin, tiles=tiles)
+            if match is not None:
+                match['latency'] = round(time.monotonic() - start, 3)
+                match['ticks'] = ticks
+                return match
+            if time.monotonic() - start >= timeout:
+                return None
+            time.sleep(max(0.0, interval - (time.monotonic() - tick_start)))
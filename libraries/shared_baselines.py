@@ -0,0 +1,329 @@
+"""
+shared_baselines - Cross-process cache of decoded baseline images
+Lets parallel pabot workers on one machine share a single decoded copy of each baseline
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import os
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from lazy_imports import LazyModule
+
+np = LazyModule('numpy', 'numpy')
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: the OS frees a segment when its last handle is closed
+    fcntl = None
+
+
+SEGMENT_PREFIX = 'ambl_'
+HEADER = struct.Struct('<4sIIIII')  # magic, state, height, width, channels, references
+REFS = struct.Struct('<I')
+REFS_OFFSET = 20
+HEADER_SIZE = 64  # keeps the pixel data cache-line aligned
+MAGIC = b'AMBL'
+STATE_WRITING = 0
+STATE_READY = 1
+STATE_FAILED = 2
+# Where Linux lists POSIX shared memory segments as files, which makes eviction possible
+SHM_DIR = Path('/dev/shm')
+
+_process_cache = None
+
+
+@contextmanager
+def _segment_lock():
+    """Serialize segment creation and reference counting between processes (POSIX only)."""
+    if fcntl is None:
+        yield
+        return
+    lock_path = Path(tempfile.gettempdir()) / f"{SEGMENT_PREFIX}{os.getuid()}.lock"
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _open_segment(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    """Open a segment that the resource tracker leaves alone.
+
+    The tracker would unlink it when this process exits, while other workers
+    still use it; segments are unlinked by reference count instead.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:
+        # Python < 3.13 always registers the segment with the resource tracker
+        shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        if os.name == 'posix':
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _unlink_segment(shm: shared_memory.SharedMemory):
+    if os.name == 'posix' and not hasattr(shm, '_track'):
+        # Python < 3.13 unregisters on unlink, so register it back first
+        resource_tracker.register(shm._name, 'shared_memory')
+    shm.unlink()
+
+
+class SharedBaselineCache:
+    """Decoded baselines stored in named shared-memory segments.
+
+    A segment's name is derived from the baseline's absolute path, size and
+    modification time, so every worker computes the same name, and an edited
+    baseline simply maps to a new name. A worker that misses decodes the image
+    and creates the segment; when another worker created it first in the
+    meantime, it attaches to that one instead, so each baseline is held once.
+
+    A segment lives as long as any worker is attached to it: the header counts
+    the attached workers (under a lock file in the temp directory on POSIX; on
+    Windows the OS does the counting), and the last worker to detach unlinks
+    it. Workers that run one after another therefore do not share: the next
+    worker decodes the baseline again.
+
+    A worker killed before its exit handlers run leaves its count behind on
+    POSIX, and one killed while creating a segment leaves it unfinished. The
+    latter is unlinked by the next worker that looks it up. For the former,
+    ``close`` evicts segments older than ``max_age`` seconds, and the oldest
+    ones beyond ``max_bytes`` in total, on Linux where ``/dev/shm`` lists them.
+
+    Args:
+        ready_timeout: How long a Windows worker waits for another worker to
+            finish filling a segment
+        max_age: Segments unused for longer than this are evicted (seconds)
+        max_bytes: Total size of the segments kept when evicting
+    """
+
+    def __init__(self, ready_timeout: float = 5.0, max_age: float = 24 * 3600,
+                 max_bytes: int = 2 * 1024 ** 3):
+        self.ready_timeout = ready_timeout
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._attached: Dict[str, Tuple[shared_memory.SharedMemory, np.ndarray]] = {}
+        atexit.register(self.close)
+
+    @staticmethod
+    def segment_name(image_path: Union[str, Path]) -> Optional[str]:
+        """Return the segment name for the current contents of ``image_path``."""
+        path = Path(image_path).resolve()
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        key = f"{path}|{stat.st_size}|{stat.st_mtime_ns}".encode('utf-8')
+        # Short names: macOS limits POSIX shared memory names to 31 characters
+        return SEGMENT_PREFIX + hashlib.sha1(key).hexdigest()[:20]
+
+    @staticmethod
+    def _add_reference(shm: shared_memory.SharedMemory, delta: int) -> Optional[int]:
+        """Change the attached-worker count; call with the segment lock held (None without counting)."""
+        if fcntl is None:
+            return None
+        references = max(0, REFS.unpack_from(shm.buf, REFS_OFFSET)[0] + delta)
+        REFS.pack_into(shm.buf, REFS_OFFSET, references)
+        return references
+
+    @staticmethod
+    def _ready_view(shm: shared_memory.SharedMemory) -> Tuple[Optional[np.ndarray], int]:
+        """Return the pixels of a filled segment (None otherwise) and its state."""
+        magic, state, height, width, channels, _ = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC:
+            return None, STATE_FAILED
+        if state != STATE_READY:
+            return None, state
+        shape = (height, width, channels) if channels else (height, width)
+        view = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=HEADER_SIZE)
+        view.flags.writeable = False
+        return view, state
+
+    def _wait_ready(self, shm: shared_memory.SharedMemory) -> Optional[np.ndarray]:
+        # Only Windows workers can see a segment before its creator filled it
+        deadline = time.monotonic() + self.ready_timeout
+        while True:
+            view, state = self._ready_view(shm)
+            if view is not None or state == STATE_FAILED or time.monotonic() > deadline:
+                return view
+            time.sleep(0.005)
+
+    def _attach(self, name: str) -> Optional[np.ndarray]:
+        """Attach to an existing segment; call with the segment lock held."""
+        try:
+            shm = _open_segment(name)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # A segment that was never sized, e.g. left behind by a crashed creator
+            if fcntl is not None:
+                self._unlink_file(SHM_DIR / name)
+            return None
+        if fcntl is None:
+            view = self._wait_ready(shm)
+        else:
+            # Segments are created and filled under the lock, so one that is not
+            # ready now never will be: its creator died or failed
+            view, _ = self._ready_view(shm)
+            if view is None:
+                try:
+                    _unlink_segment(shm)
+                except FileNotFoundError:
+                    pass
+        if view is None:
+            shm.close()
+            return None
+        self._add_reference(shm, 1)
+        self._attached[name] = (shm, view)
+        # Eviction goes by modification time; mark the segment as in use
+        self._touch(SHM_DIR / name)
+        return view
+
+    def _create(self, name: str, img: np.ndarray) -> Optional[np.ndarray]:
+        """Create and fill the segment of ``img``; call with the segment lock held."""
+        try:
+            shm = _open_segment(name, create=True, size=HEADER_SIZE + img.nbytes)
+        except FileExistsError:
+            # Another Windows worker won the race
+            return self._attach(name)
+
+        channels = img.shape[2] if img.ndim == 3 else 0
+        HEADER.pack_into(shm.buf, 0, MAGIC, STATE_WRITING, img.shape[0], img.shape[1], channels, 0)
+        try:
+            target = np.ndarray(img.shape, dtype=np.uint8, buffer=shm.buf, offset=HEADER_SIZE)
+            target[...] = img
+            del target
+        except BaseException:
+            # Waiting Windows workers give up at once, and the next lookup starts over
+            struct.pack_into('<I', shm.buf, 4, STATE_FAILED)
+            _unlink_segment(shm)
+            shm.close()
+            raise
+        # Publish: readers only map the pixels once the state flips to ready
+        struct.pack_into('<I', shm.buf, 4, STATE_READY)
+
+        view, _ = self._ready_view(shm)
+        self._add_reference(shm, 1)
+        self._attached[name] = (shm, view)
+        return view
+
+    def get(self, image_path: Union[str, Path],
+            loader: Callable[[str], Optional[np.ndarray]]) -> Optional[np.ndarray]:
+        """Return the shared copy of ``image_path``, decoding it with ``loader`` on a miss.
+
+        Returns:
+            A read-only array backed by shared memory, or whatever ``loader``
+            returned if the image cannot be shared (unsupported dtype, a
+            concurrent writer that never finished, ...).
+        """
+        name = self.segment_name(image_path)
+        if name is None:
+            return loader(str(image_path))
+
+        cached = self._attached.get(name)
+        if cached is not None:
+            return cached[1]
+
+        with _segment_lock():
+            view = self._attach(name)
+        if view is not None:
+            return view
+
+        # Decode outside the lock; another worker may publish the segment meanwhile
+        img = loader(str(image_path))
+        if img is None or img.dtype != np.uint8:
+            return img
+        with _segment_lock():
+            view = self._attach(name)
+            if view is None:
+                view = self._create(name, img)
+        return view if view is not None else img
+
+    @staticmethod
+    def _touch(path: Path):
+        if fcntl is not None and SHM_DIR.is_dir():
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _unlink_file(path: Path) -> bool:
+        try:
+            path.unlink()
+        except OSError:
+            # Gone already, or another user's segment
+            return False
+        return True
+
+    def evict(self) -> int:
+        """Unlink segments older than ``max_age`` and, oldest first, those beyond ``max_bytes``.
+
+        Only possible on Linux, where segments are files in ``/dev/shm``. Workers
+        that still have an evicted segment mapped keep using it; the next lookup
+        decodes the baseline again. Returns the number of segments unlinked.
+        """
+        if fcntl is None or not SHM_DIR.is_dir():
+            return 0
+        with _segment_lock():
+            segments = []
+            for path in SHM_DIR.glob(f"{SEGMENT_PREFIX}*"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                if path.suffix != '.lock':
+                    segments.append((stat.st_mtime, stat.st_size, path))
+            now = time.time()
+            total = 0
+            removed = 0
+            for mtime, size, path in sorted(segments, reverse=True):
+                total += size
+                if (now - mtime > self.max_age or total > self.max_bytes) and self._unlink_file(path):
+                    removed += 1
+            return removed
+
+    def close(self):
+        """Detach from all segments, unlinking those no other worker is attached to.
+
+        Then evicts stale segments, see ``evict``.
+        """
+        for name in list(self._attached):
+            shm, view = self._attached.pop(name)
+            # Drop this cache's view first, or the mapping cannot be closed
+            del view
+            with _segment_lock():
+                if self._add_reference(shm, -1) == 0:
+                    try:
+                        _unlink_segment(shm)
+                    except FileNotFoundError:
+                        pass
+            try:
+                shm.close()
+            except BufferError:
+                # A caller still holds an array backed by this segment; it stays valid
+                pass
+        self.evict()
+
+
+def get_shared_cache() -> SharedBaselineCache:
+    """Return this process's cache.
+
+    One instance per process keeps the reference counts consistent: a second
+    instance would attach and count the same segments again.
+    """
+    global _process_cache
+    if _process_cache is None:
+        _process_cache = SharedBaselineCache()
+    return _process_cache
@@ -0,0 +1,267 @@
+"""
+video_search - Find the moments a recorded video shows a given image
+Prefilters frames with tiny difference hashes and fully compares only the candidates
+
+Usage:
+    python libraries/video_search.py results/video/Case1.mp4 results/screenshots/desktop.png
+    python libraries/video_search.py video.mp4 patternAfterInstall.png --region 0,0,1920,1035 --threshold 98 --first
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from lazy_imports import LazyModule
+
+cv2 = LazyModule('cv2', 'opencv-python')
+np = LazyModule('numpy', 'numpy')
+
+from image_metrics import mse_to_similarity
+
+
+INDEX_VERSION = 1
+HASH_SIZE = 8
+FULL_FRAME = 'full'
+# Candidates at most this many frames ahead are reached by decoding forward instead of seeking
+SEEK_GAP = 30
+
+
+def index_path_for(video_path: Union[str, Path]) -> Path:
+    """Return the path of the frame index stored next to a video."""
+    video_path = Path(video_path)
+    return video_path.with_name(f"{video_path.stem}.frames.json")
+
+
+def region_key(region: Optional[Sequence[int]], step: int = 1) -> str:
+    """Index key of a frame area; sparse (``step`` > 1) indexes get their own key."""
+    key = FULL_FRAME if region is None else ','.join(str(int(v)) for v in region)
+    return key if step == 1 else f"{key}/{step}"
+
+
+def parse_region(region) -> Optional[Tuple[int, int, int, int]]:
+    """Parse ``x,y,width,height`` (string or sequence); None/empty means the full frame."""
+    if region is None or region == '' or str(region).upper() == 'NONE':
+        return None
+    if isinstance(region, str):
+        region = [part for part in region.replace(' ', ',').split(',') if part]
+    values = tuple(int(v) for v in region)
+    if len(values) != 4:
+        raise ValueError(f"Region must be 'x,y,width,height', got: {region}")
+    return values
+
+
+def crop(frame: np.ndarray, region: Optional[Sequence[int]]) -> np.ndarray:
+    if region is None:
+        return frame
+    x, y, w, h = region
+    return frame[y:y + h, x:x + w]
+
+
+def difference_hash(image: np.ndarray) -> int:
+    """64-bit difference hash (dHash) of a BGR or grayscale image."""
+    small = cv2.resize(image, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def load_index(video_path: Union[str, Path]) -> Optional[dict]:
+    """Load the frame index of a video, or None if it is missing or older than the video."""
+    path = index_path_for(video_path)
+    try:
+        if path.stat().st_mtime_ns < Path(video_path).stat().st_mtime_ns:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if index.get('version') == INDEX_VERSION else None
+
+
+def merge_index(video_path: Union[str, Path], fps: float, frame_size: Tuple[int, int],
+                entries: Dict[str, List[list]], frame_count: Optional[int] = None) -> dict:
+    """Return the frame index of a video extended with ``entries``, without writing it.
+
+    ``entries`` maps a region key to ``[frame_number, seconds, hash_hex]`` rows.
+    """
+    index = load_index(video_path) or {'version': INDEX_VERSION, 'regions': {}}
+    index['fps'] = fps
+    index['frame_size'] = list(frame_size)
+    if frame_count is not None:
+        index['frame_count'] = frame_count
+    index['regions'].update(entries)
+    return index
+
+
+def save_index(video_path: Union[str, Path], fps: float, frame_size: Tuple[int, int],
+               entries: Dict[str, List[list]], frame_count: Optional[int] = None) -> dict:
+    """Write (or extend) the frame index of a video; see ``merge_index``."""
+    index = merge_index(video_path, fps, frame_size, entries, frame_count)
+
+    path = index_path_for(video_path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+    return index
+
+
+def build_index(video_path: Union[str, Path], region: Optional[Sequence[int]] = None,
+                step: int = 1) -> dict:
+    """Stream-decode a video once and hash every ``step``-th frame."""
+    capture = cv2.VideoCapture(str(video_path))
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 10.0
+    frame_size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    entries = []
+    frame_number = 0
+    try:
+        while capture.grab():
+            if frame_number % step == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                entries.append([frame_number, round(frame_number / fps, 3),
+                                format(difference_hash(crop(frame, region)), '016x')])
+            frame_number += 1
+    finally:
+        capture.release()
+
+    return save_index(video_path, fps, frame_size, {region_key(region, step): entries}, frame_count=frame_number)
+
+
+def find_matching_frames(video_path: Union[str, Path], image: Union[str, Path, np.ndarray],
+                         threshold: float = 95.0, region=None, max_hash_distance: int = 12,
+                         first_only: bool = False, step: int = 1) -> List[Dict]:
+    """Find the frames of a video that match an image.
+
+    Every indexed frame is compared by difference hash first; only frames whose
+    hash is within ``max_hash_distance`` bits of the image's hash are decoded
+    (by seeking to them) and scored with the MSE similarity used by
+    ImageComparisonLibrary. The image is compared with the whole frame area,
+    so it must have the size of the frame, or of ``region`` if given: capture
+    it with the same region (a small template would never match the frame).
+
+    The per-frame hashes are cached in ``<video>.frames.json``, per region.
+    Videos recorded by VideoRecorderLibrary already have them for the full
+    frame and for the regions passed as ``index_regions`` while recording;
+    searching any other region decodes the whole video once to index it.
+
+    Args:
+        video_path: Recorded video
+        image: Image (path or BGR array) to look for
+        threshold: Minimum similarity (0-100) for a frame to match
+        region: ``x,y,width,height`` of the frames to compare, default full frame;
+            the image must have this size
+        max_hash_distance: Hash prefilter tolerance in bits (0-64)
+        first_only: Stop at the first matching frame
+        step: When the index has to be built, hash only every ``step``-th frame
+
+    Returns:
+        Matches as dicts with ``frame``, ``time`` (seconds) and ``similarity``
+
+    Raises:
+        ValueError: The image size differs from the compared frame area
+    """
+    region = parse_region(region)
+    if isinstance(image, np.ndarray):
+        target = image
+    else:
+        target = cv2.imread(str(image))
+        if target is None:
+            raise ValueError(f"Could not load image: {image}")
+
+    index = load_index(video_path)
+    regions = index['regions'] if index is not None else {}
+    if region_key(region) in regions:
+        # A dense index serves any step
+        entries = [entry for entry in regions[region_key(region)] if entry[0] % step == 0]
+    elif region_key(region, step) in regions:
+        entries = regions[region_key(region, step)]
+    else:
+        index = build_index(video_path, region, step)
+        entries = index['regions'][region_key(region, step)]
+
+    width, height = region[2:] if region else index['frame_size']
+    if target.shape[:2] != (height, width):
+        raise ValueError(f"Image is {target.shape[1]}x{target.shape[0]} but the compared frame area is "
+                         f"{width}x{height}; use an image of the whole frame, or pass the region it "
+                         f"was captured from")
+    target_hash = difference_hash(target)
+
+    capture = cv2.VideoCapture(str(video_path))
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+
+    matches = []
+    next_frame = 0
+    try:
+        for frame_number, seconds, hash_hex in entries:
+            if hamming_distance(int(hash_hex, 16), target_hash) > max_hash_distance:
+                continue
+
+            # Decode forward through short gaps between candidates, seek over long ones
+            gap = frame_number - next_frame
+            if gap < 0 or gap > SEEK_GAP:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+            else:
+                for _ in range(gap):
+                    capture.grab()
+            ok, frame = capture.read()
+            next_frame = frame_number + 1
+            if not ok:
+                continue
+
+            frame_area = crop(frame, region)
+            if frame_area.shape != target.shape:
+                continue
+            diff = frame_area.astype(np.float32) - target.astype(np.float32)
+            similarity = mse_to_similarity(float(np.mean(np.square(diff))))
+            if similarity >= threshold:
+                matches.append({'frame': frame_number, 'time': seconds, 'similarity': round(similarity, 3)})
+                if first_only:
+                    break
+    finally:
+        capture.release()
+
+    return matches
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Find the frames of a recorded video that match an image.")
+    parser.add_argument('video', help="Recorded video (mp4)")
+    parser.add_argument('image', help="Image to look for")
+    parser.add_argument('--threshold', type=float, default=95.0, help="Minimum similarity (default: 95.0)")
+    parser.add_argument('--region', help="x,y,width,height of the frame area to compare")
+    parser.add_argument('--max-hash-distance', type=int, default=12,
+                        help="Hash prefilter tolerance in bits (default: 12)")
+    parser.add_argument('--first', action='store_true', help="Stop at the first match")
+    parser.add_argument('--json', action='store_true', help="Print matches as JSON")
+    args = parser.parse_args(argv)
+
+    matches = find_matching_frames(args.video, args.image, args.threshold, args.region,
+                                   args.max_hash_distance, args.first)
+    if args.json:
+        print(json.dumps(matches, indent=2))
+    elif not matches:
+        print("No matching frames.")
+    else:
+        for match in matches:
+            print(f"{match['time']:10.3f}s  frame {match['frame']:6d}  similarity {match['similarity']:.2f}%")
+    return 0 if matches else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+visual_metrics - Lightweight hot-path instrumentation for the visual libraries
+Collects per-phase timings, byte counts and gauges that VisualMetricsListener exports
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+class MetricsRecorder:
+    """Process-wide collector of metric events.
+
+    Libraries report into it unconditionally; it only keeps events while
+    ``enabled`` is set, which VisualMetricsListener does when it is attached, so
+    an uninstrumented run pays one attribute check per event and never
+    accumulates memory.
+
+    Events are plain dicts with a ``kind`` of ``phase`` (milliseconds),
+    ``bytes`` or ``value``, tagged with the reporting library.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._events: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def _add(self, library: str, kind: str, name: str, value):
+        event = {'library': library, 'kind': kind, 'name': name, 'value': value}
+        with self._lock:
+            self._events.append(event)
+
+    @contextmanager
+    def phase(self, library: str, name: str):
+        """Time the enclosed block as phase ``name``."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(library, 'phase', name, (time.perf_counter() - start) * 1000)
+
+    def add_phase_time(self, library: str, name: str, milliseconds: float):
+        """Record time measured by the caller, e.g. accumulated in a loop."""
+        if self.enabled:
+            self._add(library, 'phase', name, milliseconds)
+
+    def add_bytes(self, library: str, name: str, count: int):
+        if self.enabled:
+            self._add(library, 'bytes', name, int(count))
+
+    def set_value(self, library: str, name: str, value):
+        if self.enabled:
+            self._add(library, 'value', name, value)
+
+    def drain(self) -> List[Dict]:
+        """Return and forget all events recorded so far."""
+        with self._lock:
+            events, self._events = self._events, []
+        return events
+
+
+def summarize(events: List[Dict]) -> Dict[str, Dict]:
+    """Fold events into ``{'phases_ms': ..., 'bytes': ..., 'values': ...}``.
+
+    Repeated phases and byte counters are summed; for values the last one wins.
+    """
+    summary = {'phases_ms': {}, 'bytes': {}, 'values': {}}
+    for event in events:
+        name, value = event['name'], event['value']
+        if event['kind'] == 'phase':
+            summary['phases_ms'][name] = round(summary['phases_ms'].get(name, 0.0) + value, 3)
+        elif event['kind'] == 'bytes':
+            summary['bytes'][name] = summary['bytes'].get(name, 0) + value
+        else:
+            summary['values'][name] = value
+    return summary
+
+
+METRICS = MetricsRecorder()
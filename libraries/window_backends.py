@@ -0,0 +1,427 @@
+"""
+window_backends - Window lookup, geometry and capture for the visual libraries
+Win32 implementation for the real desktop and an in-memory fake desktop for headless (Linux) runs
+"""
+
+from __future__ import annotations
+
+import ctypes
+import importlib
+import itertools
+import threading
+import time
+from ctypes import wintypes
+from typing import Dict, List, Optional, Tuple
+
+from lazy_imports import LazyModule
+
+cv2 = LazyModule('cv2', 'opencv-python')
+np = LazyModule('numpy', 'numpy')
+
+
+# Window rectangle in screen coordinates: (x, y, width, height)
+Rect = Tuple[int, int, int, int]
+WINDOW_STATES = ('minimize', 'maximize', 'restore')
+
+
+def intersect(rect: Rect, bounds: Rect) -> Optional[Rect]:
+    """Part of ``rect`` inside ``bounds``, None if they do not overlap."""
+    x0, y0 = max(rect[0], bounds[0]), max(rect[1], bounds[1])
+    x1 = min(rect[0] + rect[2], bounds[0] + bounds[2])
+    y1 = min(rect[1] + rect[3], bounds[1] + bounds[3])
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+class WindowBackend:
+    """Interface between the window keywords and a window system.
+
+    Windows are identified by opaque handles. ``list_windows`` returns the
+    visible, titled windows top-most first, so ``find_window`` picks the
+    window the user sees on top when several titles match.
+    """
+
+    def list_windows(self) -> List[Tuple[object, str]]:
+        """``(handle, title)`` of all visible windows with a title, top-most first."""
+        raise NotImplementedError
+
+    def find_window(self, title_substring: str):
+        """Handle of the first window whose title contains ``title_substring`` (case-insensitive), or None."""
+        wanted = title_substring.lower()
+        for handle, title in self.list_windows():
+            if wanted in title.lower():
+                return handle
+        return None
+
+    def get_title(self, handle) -> str:
+        raise NotImplementedError
+
+    def get_rect(self, handle) -> Rect:
+        """Visible frame of the window in screen coordinates."""
+        raise NotImplementedError
+
+    def wait_for_stable_rect(self, handle, timeout: float = 0.5, interval: float = 0.05) -> Rect:
+        """Wait until the window stops moving, e.g. after a restore animation, and return its rectangle.
+
+        The rectangle is stable once two reads ``interval`` seconds apart agree;
+        after ``timeout`` seconds the last one read is returned.
+        """
+        deadline = time.monotonic() + timeout
+        rect = self.get_rect(handle)
+        while time.monotonic() < deadline:
+            time.sleep(interval)
+            previous, rect = rect, self.get_rect(handle)
+            if rect == previous:
+                break
+        return rect
+
+    def is_minimized(self, handle) -> bool:
+        raise NotImplementedError
+
+    def show_window(self, handle, state: str):
+        """Minimize, maximize or restore the window (one of ``WINDOW_STATES``)."""
+        raise NotImplementedError
+
+    def set_foreground(self, handle):
+        raise NotImplementedError
+
+    def screen_rect(self) -> Rect:
+        """Bounds of the (virtual) screen, spanning all monitors."""
+        raise NotImplementedError
+
+    def capture(self, rect: Rect) -> np.ndarray:
+        """Capture ``rect`` of the screen as a BGR array; only that area is read."""
+        raise NotImplementedError
+
+
+class _BITMAPINFOHEADER(ctypes.Structure):
+    _fields_ = [
+        ('biSize', wintypes.DWORD),
+        ('biWidth', wintypes.LONG),
+        ('biHeight', wintypes.LONG),
+        ('biPlanes', wintypes.WORD),
+        ('biBitCount', wintypes.WORD),
+        ('biCompression', wintypes.DWORD),
+        ('biSizeImage', wintypes.DWORD),
+        ('biXPelsPerMeter', wintypes.LONG),
+        ('biYPelsPerMeter', wintypes.LONG),
+        ('biClrUsed', wintypes.DWORD),
+        ('biClrImportant', wintypes.DWORD),
+    ]
+
+
+class Win32WindowBackend(WindowBackend):
+    """Windows desktop through user32, dwmapi and gdi32 (ctypes, no extra dependencies).
+
+    The DLLs are loaded on first use, so the backend can be created (and the
+    libraries imported) on any platform.
+    """
+
+    SW_MINIMIZE = 6
+    SW_MAXIMIZE = 3
+    SW_RESTORE = 9
+    SW_SHOW = 5
+    # Frame without the invisible resize borders of Windows 10+
+    DWMWA_EXTENDED_FRAME_BOUNDS = 9
+    SM_XVIRTUALSCREEN, SM_YVIRTUALSCREEN, SM_CXVIRTUALSCREEN, SM_CYVIRTUALSCREEN = 76, 77, 78, 79
+    SRCCOPY = 0x00CC0020
+    CAPTUREBLT = 0x40000000
+
+    def __init__(self):
+        self._user32 = None
+        self._gdi32 = None
+        self._dwmapi = None
+
+    @property
+    def user32(self):
+        """user32.dll, loaded on first use so the backend imports on any platform"""
+        if self._user32 is None:
+            if not hasattr(ctypes, 'windll'):
+                raise RuntimeError("The win32 window backend requires Windows (user32.dll is not available)")
+            # Window rectangles and captures in physical pixels, as pyautogui uses them
+            ctypes.windll.user32.SetProcessDPIAware()
+            self._user32 = ctypes.windll.user32
+        return self._user32
+
+    @property
+    def gdi32(self):
+        """Private gdi32/user32 handles with prototypes, so 64-bit handles are not truncated"""
+        if self._gdi32 is None:
+            self.user32  # platform check and DPI awareness first
+            user32 = ctypes.WinDLL('user32')
+            gdi32 = ctypes.WinDLL('gdi32')
+            user32.GetDC.argtypes = [wintypes.HWND]
+            user32.GetDC.restype = wintypes.HDC
+            user32.ReleaseDC.argtypes = [wintypes.HWND, wintypes.HDC]
+            gdi32.CreateCompatibleDC.argtypes = [wintypes.HDC]
+            gdi32.CreateCompatibleDC.restype = wintypes.HDC
+            gdi32.CreateCompatibleBitmap.argtypes = [wintypes.HDC, ctypes.c_int, ctypes.c_int]
+            gdi32.CreateCompatibleBitmap.restype = wintypes.HBITMAP
+            gdi32.SelectObject.argtypes = [wintypes.HDC, wintypes.HGDIOBJ]
+            gdi32.SelectObject.restype = wintypes.HGDIOBJ
+            gdi32.BitBlt.argtypes = [wintypes.HDC, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                     wintypes.HDC, ctypes.c_int, ctypes.c_int, wintypes.DWORD]
+            gdi32.GetDIBits.argtypes = [wintypes.HDC, wintypes.HBITMAP, wintypes.UINT, wintypes.UINT,
+                                        ctypes.c_void_p, ctypes.c_void_p, wintypes.UINT]
+            gdi32.DeleteObject.argtypes = [wintypes.HGDIOBJ]
+            gdi32.DeleteDC.argtypes = [wintypes.HDC]
+            self._gdi32 = (user32, gdi32)
+        return self._gdi32
+
+    def _window_text(self, hwnd) -> str:
+        length = self.user32.GetWindowTextLengthW(hwnd)
+        buff = ctypes.create_unicode_buffer(length + 1)
+        self.user32.GetWindowTextW(hwnd, buff, length + 1)
+        return buff.value
+
+    def list_windows(self) -> List[Tuple[object, str]]:
+        user32 = self.user32
+        windows = []
+
+        def enum_windows_callback(hwnd, lparam):
+            if user32.IsWindowVisible(hwnd) and user32.GetWindowTextLengthW(hwnd) > 0:
+                windows.append((hwnd, self._window_text(hwnd)))
+            return True  # Continue enumeration
+
+        EnumWindowsProc = ctypes.WINFUNCTYPE(
+            wintypes.BOOL,
+            wintypes.HWND,
+            wintypes.LPARAM
+        )
+        user32.EnumWindows(EnumWindowsProc(enum_windows_callback), 0)
+        return windows
+
+    def get_title(self, handle) -> str:
+        return self._window_text(handle)
+
+    def get_rect(self, handle) -> Rect:
+        # DPI awareness first, or DWM reports the rectangle in scaled pixels
+        user32 = self.user32
+        rect = wintypes.RECT()
+        try:
+            if self._dwmapi is None:
+                self._dwmapi = ctypes.windll.dwmapi
+            failed = self._dwmapi.DwmGetWindowAttribute(wintypes.HWND(handle), self.DWMWA_EXTENDED_FRAME_BOUNDS,
+                                                        ctypes.byref(rect), ctypes.sizeof(rect))
+        except OSError:
+            failed = True
+        if failed:
+            user32.GetWindowRect(wintypes.HWND(handle), ctypes.byref(rect))
+        return rect.left, rect.top, rect.right - rect.left, rect.bottom - rect.top
+
+    def is_minimized(self, handle) -> bool:
+        return bool(self.user32.IsIconic(handle))
+
+    def show_window(self, handle, state: str):
+        commands = {'minimize': self.SW_MINIMIZE, 'maximize': self.SW_MAXIMIZE, 'restore': self.SW_RESTORE}
+        self.user32.ShowWindow(handle, commands[state])
+
+    def set_foreground(self, handle):
+        self.user32.SetForegroundWindow(handle)
+
+    def screen_rect(self) -> Rect:
+        metrics = self.user32.GetSystemMetrics
+        return (metrics(self.SM_XVIRTUALSCREEN), metrics(self.SM_YVIRTUALSCREEN),
+                metrics(self.SM_CXVIRTUALSCREEN), metrics(self.SM_CYVIRTUALSCREEN))
+
+    def capture(self, rect: Rect) -> np.ndarray:
+        x, y, width, height = rect
+        user32, gdi32 = self.gdi32
+        screen_dc = user32.GetDC(None)
+        memory_dc = gdi32.CreateCompatibleDC(screen_dc)
+        bitmap = gdi32.CreateCompatibleBitmap(screen_dc, width, height)
+        try:
+            previous = gdi32.SelectObject(memory_dc, bitmap)
+            copied = gdi32.BitBlt(memory_dc, 0, 0, width, height, screen_dc, x, y,
+                                  self.SRCCOPY | self.CAPTUREBLT)
+            gdi32.SelectObject(memory_dc, previous)
+            if not copied:
+                raise OSError(f"Could not capture screen area {rect}")
+
+            header = _BITMAPINFOHEADER()
+            header.biSize = ctypes.sizeof(header)
+            header.biWidth = width
+            header.biHeight = -height  # top-down rows
+            header.biPlanes = 1
+            header.biBitCount = 32
+            pixels = np.empty((height, width, 4), dtype=np.uint8)
+            rows = gdi32.GetDIBits(memory_dc, bitmap, 0, height, pixels.ctypes.data, ctypes.byref(header), 0)
+            if rows != height:
+                raise OSError(f"Could not read captured screen area {rect}")
+        finally:
+            gdi32.DeleteObject(bitmap)
+            gdi32.DeleteDC(memory_dc)
+            user32.ReleaseDC(None, screen_dc)
+        # BGRA -> BGR
+        return pixels[:, :, :3].copy()
+
+
+class FakeWindowBackend(WindowBackend):
+    """In-memory desktop for running the window keywords without a window system.
+
+    Windows are painted onto a synthetic screen bottom-most first; each one
+    shows ``content`` (a BGR array, scaled to the window) or a solid fill with
+    its title. Windows can be moved, minimized, maximized and raised like real
+    ones, so captures follow them.
+
+    Args:
+        width: Screen width in pixels
+        height: Screen height in pixels
+    """
+
+    def __init__(self, width: int = 1920, height: int = 1080):
+        self.width = width
+        self.height = height
+        self._lock = threading.Lock()
+        self._handles = itertools.count(0x10010)
+        # Top-most first, as EnumWindows returns them
+        self._windows: List[Dict] = []
+
+    def add_window(self, title: str, x: int, y: int, width: int, height: int,
+                   content: Optional[np.ndarray] = None, color: Tuple[int, int, int] = (240, 240, 240)) -> int:
+        """Open a window on top of the others and return its handle."""
+        window = {
+            'handle': next(self._handles),
+            'title': title,
+            'rect': (int(x), int(y), int(width), int(height)),
+            'normal_rect': None,
+            'minimized': False,
+            'content': content,
+            'color': tuple(color),
+        }
+        with self._lock:
+            self._windows.insert(0, window)
+        return window['handle']
+
+    def close_window(self, handle):
+        with self._lock:
+            self._windows = [w for w in self._windows if w['handle'] != handle]
+
+    def move_window(self, handle, x: int, y: int, width: Optional[int] = None, height: Optional[int] = None):
+        window = self._window(handle)
+        _, _, old_width, old_height = window['rect']
+        window['rect'] = (int(x), int(y), int(width or old_width), int(height or old_height))
+
+    def set_content(self, handle, content: Optional[np.ndarray]):
+        self._window(handle)['content'] = content
+
+    def _window(self, handle) -> Dict:
+        with self._lock:
+            for window in self._windows:
+                if window['handle'] == handle:
+                    return window
+        raise ValueError(f"No fake window with handle {handle!r}")
+
+    def list_windows(self) -> List[Tuple[object, str]]:
+        with self._lock:
+            return [(w['handle'], w['title']) for w in self._windows if w['title']]
+
+    def get_title(self, handle) -> str:
+        return self._window(handle)['title']
+
+    def get_rect(self, handle) -> Rect:
+        window = self._window(handle)
+        if window['minimized']:
+            # Where Windows parks minimized windows
+            return -32000, -32000, 160, 28
+        return window['rect']
+
+    def is_minimized(self, handle) -> bool:
+        return self._window(handle)['minimized']
+
+    def show_window(self, handle, state: str):
+        window = self._window(handle)
+        if state == 'minimize':
+            window['minimized'] = True
+        elif state == 'maximize':
+            window['minimized'] = False
+            if window['normal_rect'] is None:
+                window['normal_rect'] = window['rect']
+            window['rect'] = self.screen_rect()
+        elif state == 'restore':
+            if window['minimized']:
+                window['minimized'] = False
+            elif window['normal_rect'] is not None:
+                window['rect'], window['normal_rect'] = window['normal_rect'], None
+        else:
+            raise ValueError(f"Unknown window state '{state}', use one of {WINDOW_STATES}")
+
+    def set_foreground(self, handle):
+        window = self._window(handle)
+        with self._lock:
+            self._windows.remove(window)
+            self._windows.insert(0, window)
+
+    def screen_rect(self) -> Rect:
+        return 0, 0, self.width, self.height
+
+    def _paint(self, window: Dict) -> np.ndarray:
+        _, _, width, height = window['rect']
+        if window['content'] is not None:
+            content = window['content']
+            if content.shape[:2] != (height, width):
+                content = cv2.resize(content, (width, height), interpolation=cv2.INTER_NEAREST)
+            return content
+        surface = np.full((height, width, 3), window['color'], dtype=np.uint8)
+        cv2.rectangle(surface, (0, 0), (width - 1, min(height, 30) - 1), (120, 80, 40), -1)
+        cv2.putText(surface, window['title'], (8, 21), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (255, 255, 255), 1)
+        return surface
+
+    def capture(self, rect: Rect) -> np.ndarray:
+        x, y, width, height = rect
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        visible = intersect(rect, self.screen_rect())
+        if visible is not None:
+            vx, vy, vw, vh = visible
+            # Desktop background: a fixed gradient, so captures are deterministic
+            gradient = np.linspace(90, 150, self.width, dtype=np.uint8)[vx:vx + vw]
+            frame[vy - y:vy - y + vh, vx - x:vx - x + vw] = gradient[None, :, None]
+        if visible is None:
+            return frame
+        with self._lock:
+            windows = [w for w in reversed(self._windows) if not w['minimized']]
+        for window in windows:
+            # Like the real screen, nothing is shown beyond its edges
+            part = intersect(window['rect'], visible)
+            if part is None:
+                continue
+            px, py, pw, ph = part
+            wx, wy = window['rect'][:2]
+            surface = self._paint(window)
+            frame[py - y:py - y + ph, px - x:px - x + pw] = surface[py - wy:py - wy + ph, px - wx:px - wx + pw]
+        return frame
+
+
+BACKENDS = {
+    'win32': Win32WindowBackend,
+    'fake': FakeWindowBackend,
+}
+
+_backends: Dict[str, WindowBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_window_backend(name: str = 'auto') -> WindowBackend:
+    """Return the backend registered as ``name``, shared by all libraries in this process.
+
+    ``name`` is ``'auto'`` (the Win32 backend), one of ``BACKENDS``, or the
+    dotted path of a ``WindowBackend`` subclass (``'my_backends.X11Backend'``)
+    that can be created without arguments. Libraries importing the same name
+    share one instance, so a fake desktop populated through one library is
+    the desktop the other one sees.
+    """
+    key = 'win32' if name in (None, '', 'auto') else str(name)
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            if key in BACKENDS:
+                backend = BACKENDS[key]()
+            elif '.' in key:
+                module_name, class_name = key.rsplit('.', 1)
+                backend = getattr(importlib.import_module(module_name), class_name)()
+            else:
+                raise ValueError(f"Unknown window backend '{name}'. Use 'auto', one of "
+                                 f"{sorted(BACKENDS)} or the dotted path of a WindowBackend class.")
+            _backends[key] = backend
+        return backend
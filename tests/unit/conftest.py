@@ -0,0 +1,8 @@
+"""Unit tests for the helper modules in libraries/ (run with ``python -m pytest tests/unit``)."""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / 'libraries'))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
@@ -0,0 +1,59 @@
+"""Background artifact writer: ordering, flushing and error reporting."""
+
+import threading
+
+import cv2
+import numpy as np
+
+from artifact_writer import ArtifactWriter
+
+
+def test_png_is_written_and_flushed(tmp_path):
+    writer = ArtifactWriter()
+    image = np.arange(48, dtype=np.uint8).reshape(4, 4, 3)
+    writer.write_png(tmp_path / 'image.png', image, compression=1)
+    assert writer.flush() == []
+    assert writer.pending == 0
+    assert np.array_equal(cv2.imread(str(tmp_path / 'image.png')), image)
+    writer.close()
+
+
+def test_later_write_to_the_same_file_wins(tmp_path):
+    writer = ArtifactWriter(workers=2)
+    release = threading.Event()
+    target = tmp_path / 'artifact.bin'
+
+    def slow_first():
+        release.wait(5)
+        return b'first'
+    writer.write(target, slow_first)
+    writer.write(target, lambda: b'second')
+    release.set()
+    writer.flush()
+    assert target.read_bytes() == b'second'
+    writer.close()
+
+
+def test_wait_for_blocks_until_the_file_exists(tmp_path):
+    writer = ArtifactWriter()
+    release = threading.Event()
+    target = tmp_path / 'waited.json'
+    writer.write(target, lambda: release.wait(5) and b'{}')
+    assert not target.exists()
+    release.set()
+    writer.wait_for(target)
+    assert target.read_bytes() == b'{}'
+    writer.close()
+
+
+def test_failed_writes_are_reported_once(tmp_path):
+    writer = ArtifactWriter()
+
+    def broken():
+        raise RuntimeError('encoder failed')
+    writer.write(tmp_path / 'broken.png', broken)
+    errors = writer.flush()
+    assert len(errors) == 1 and 'encoder failed' in errors[0]
+    assert writer.flush() == []
+    assert not (tmp_path / 'broken.png').exists()
+    writer.close()
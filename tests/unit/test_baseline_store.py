@@ -0,0 +1,106 @@
+"""Precompiled baselines: compiled copies are used only while in sync with their PNG."""
+
+import os
+
+import cv2
+import numpy as np
+
+import baseline_store
+from baseline_store import BaselineStore
+
+
+def write_png(path, seed, shape=(40, 60, 3)):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    image = np.random.default_rng(seed).integers(0, 256, size=shape, dtype=np.uint8)
+    cv2.imwrite(str(path), image)
+    return image
+
+
+def test_compiled_copy_is_memory_mapped_and_identical(tmp_path):
+    image = write_png(tmp_path / 'expected' / 'start.png', 1)
+    write_png(tmp_path / 'expected' / 'nested' / 'icon.png', 2, shape=(16, 16))
+    store = BaselineStore()
+
+    stats = store.compile_directory(tmp_path / 'expected')
+
+    assert stats == {'compiled': 2, 'skipped': 0, 'failed': 0}
+    loaded = store.load(tmp_path / 'expected' / 'start.png')
+    assert isinstance(loaded, np.memmap) and not loaded.flags.writeable
+    assert np.array_equal(loaded, image)
+    # Grayscale PNGs are decoded as BGR, like cv2.imread does
+    assert np.array_equal(store.load(tmp_path / 'expected' / 'nested' / 'icon.png'),
+                          cv2.imread(str(tmp_path / 'expected' / 'nested' / 'icon.png')))
+    assert (tmp_path / 'expected' / 'nested' / baseline_store.COMPILED_DIR_NAME).is_dir()
+
+
+def test_up_to_date_images_are_skipped_unless_forced(tmp_path):
+    write_png(tmp_path / 'start.png', 1)
+    store = BaselineStore()
+    store.compile_directory(tmp_path)
+    assert store.compile_directory(tmp_path) == {'compiled': 0, 'skipped': 1, 'failed': 0}
+    assert store.compile_directory(tmp_path, force=True) == {'compiled': 1, 'skipped': 0, 'failed': 0}
+
+
+def test_edited_png_makes_the_compiled_copy_stale(tmp_path):
+    path = tmp_path / 'start.png'
+    write_png(path, 1)
+    store = BaselineStore()
+    store.compile_directory(tmp_path)
+
+    write_png(path, 2, shape=(40, 61, 3))
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert store.load(path) is None
+
+    store.compile_directory(tmp_path)
+    assert np.array_equal(store.load(path), cv2.imread(str(path)))
+
+
+def test_missing_or_broken_compiled_copies_fall_back_to_none(tmp_path):
+    write_png(tmp_path / 'start.png', 1)
+    store = BaselineStore()
+    assert store.load(tmp_path / 'start.png') is None
+
+    (tmp_path / 'broken.png').write_bytes(b'not an image')
+    assert store.compile_directory(tmp_path)['failed'] == 1
+    assert store.load(tmp_path / 'broken.png') is None
+    assert store.load(tmp_path / 'unknown.png') is None
+
+
+def test_command_line(tmp_path, capsys):
+    write_png(tmp_path / 'start.png', 1)
+    assert baseline_store.main([str(tmp_path)]) == 0
+    assert '1 compiled' in capsys.readouterr().out
+
+
+def test_recompiling_never_rewrites_a_mapped_file(tmp_path, monkeypatch):
+    path = tmp_path / 'start.png'
+    first = write_png(path, 1)
+    store = BaselineStore()
+    store.compile_directory(tmp_path)
+    mapped = store.load(path)
+
+    # Windows refuses to delete a file another worker has mapped
+    real_unlink = type(path).unlink
+
+    def unlink_unless_mapped(self, *args, **kwargs):
+        if self.suffix == '.npy':
+            raise PermissionError(f"{self.name} is in use")
+        return real_unlink(self, *args, **kwargs)
+    monkeypatch.setattr(type(path), 'unlink', unlink_unless_mapped)
+
+    second = write_png(path, 2)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert store.compile_directory(tmp_path)['compiled'] == 1
+    assert np.array_equal(mapped, first)
+    assert np.array_equal(store.load(path), second)
+
+    # Once the old mapping is gone, the next compile removes the superseded file
+    monkeypatch.undo()
+    del mapped
+    compiled_dir = tmp_path / baseline_store.COMPILED_DIR_NAME
+    assert len(list(compiled_dir.glob('*.npy'))) == 2
+    store.compile_directory(tmp_path)
+    assert len(list(compiled_dir.glob('*.npy'))) == 1
+    assert np.array_equal(store.load(path), second)
@@ -0,0 +1,78 @@
+"""Patches diff mode: regions, their scores and the rendered patches."""
+
+import json
+
+import numpy as np
+import pytest
+
+import diff_patches
+
+
+def ui(height=300, width=400):
+    image = np.full((height, width, 3), 240, dtype=np.uint8)
+    image[:30] = (120, 60, 20)
+    return image
+
+
+def test_changes_are_grouped_into_regions_largest_first():
+    expected = ui()
+    actual = expected.copy()
+    actual[100:140, 200:260] = (0, 0, 255)             # changed button
+    for x in range(50, 90, 6):                          # a word of text: nearby pixels, one region
+        actual[250:254, x:x + 3] = 0
+    actual[10, 10] = (121, 60, 20)                      # single noisy pixel
+
+    result = diff_patches.diff_regions(expected, actual)
+
+    assert [region['box'] for region in result['regions']] == [[200, 100, 60, 40], [50, 250, 39, 4]]
+    assert result['omitted'] == 0
+    button = result['regions'][0]
+    assert button['diff_pixels'] == 40 * 60
+    assert button['patch_box'] == [194, 94, 72, 52]
+    assert 0 <= button['similarity'] < 100
+    assert result['diff_pixels'] == np.count_nonzero(result['diff_gray'])
+
+
+def test_identical_images_have_no_regions():
+    result = diff_patches.diff_regions(ui(), ui())
+    assert result['regions'] == [] and result['diff_pixels'] == 0
+
+
+def test_regions_beyond_the_limit_are_counted():
+    expected = ui()
+    actual = expected.copy()
+    for i in range(5):
+        actual[50 + 40 * i:60 + 40 * i, 50:50 + 10 + 5 * i] = 0
+    result = diff_patches.diff_regions(expected, actual, max_regions=3)
+    assert len(result['regions']) == 3 and result['omitted'] == 2
+    # Largest first
+    assert [region['box'][2] for region in result['regions']] == [30, 25, 20]
+
+
+@pytest.mark.parametrize('box, zoom', [((10, 10, 20, 10), 8), ((0, 0, 100, 40), 1), ((0, 0, 400, 300), 1), ((0, 0, 960, 600), 0.5)])
+def test_patches_are_zoomed_towards_a_readable_size(box, zoom):
+    expected = ui(600, 960)
+    actual = 255 - expected
+    result = diff_patches.diff_regions(expected, actual)
+    patch = diff_patches.render_patch(expected, actual, result['diff_gray'], box)
+    width, height = round(box[2] * zoom), round(box[3] * zoom)
+    assert patch.shape == (height, 3 * width + 2 * 4, 3)
+
+
+def test_library_writes_overview_patches_and_region_list(tmp_path):
+    from ImageComparisonLibrary import ImageComparisonLibrary
+    import cv2
+    expected = ui()
+    actual = expected.copy()
+    actual[100:140, 200:260] = (0, 0, 255)
+    cv2.imwrite(str(tmp_path / 'expected.png'), expected)
+    cv2.imwrite(str(tmp_path / 'actual.png'), actual)
+    library = ImageComparisonLibrary(diff_mode='patches')
+    library.output_dir = tmp_path / 'out'
+
+    assert not library.compare_images(str(tmp_path / 'expected.png'), str(tmp_path / 'actual.png'), 99.5)
+
+    regions_file, = (tmp_path / 'out' / 'diff').glob('*_regions.json')
+    summary = json.loads(regions_file.read_text())
+    assert [region['box'] for region in summary['regions']] == [[200, 100, 60, 40]]
+    assert (regions_file.parent / summary['regions'][0]['patch']).exists()
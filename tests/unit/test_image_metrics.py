@@ -0,0 +1,60 @@
+"""The one-pass MSE similarity must score exactly like the NumPy expression it replaces."""
+
+import numpy as np
+import pytest
+
+import image_metrics
+from bench_visual import make_pair
+
+
+def numpy_similarity(expected, actual):
+    diff = expected.astype(np.float64) - actual.astype(np.float64)
+    return image_metrics.mse_to_similarity(float(np.mean(diff ** 2)))
+
+
+def checkerboard(height, width):
+    cells = (np.indices((height, width)).sum(axis=0) % 2).astype(np.uint8) * 255
+    return np.dstack([cells] * 3)
+
+
+def test_checkerboard_against_its_inverse_scores_zero():
+    board = checkerboard(64, 64)
+    assert image_metrics.mse_similarity(board, 255 - board) == 0.0
+
+
+def test_identical_images_score_100():
+    img = np.random.default_rng(0).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    assert image_metrics.mse_similarity(img, img.copy()) == 100.0
+
+
+@pytest.mark.parametrize('shape', [(48, 64, 3), (37, 53), (1, 1, 3)])
+def test_matches_numpy_on_random_images(shape):
+    rng = np.random.default_rng(1)
+    expected = rng.integers(0, 256, shape, dtype=np.uint8)
+    actual = rng.integers(0, 256, shape, dtype=np.uint8)
+    assert image_metrics.mse_similarity(expected, actual) == pytest.approx(
+        numpy_similarity(expected, actual), abs=1e-9)
+
+
+@pytest.mark.parametrize('kind', ['identical', 'noisy', 'shifted'])
+def test_matches_numpy_on_benchmark_pairs(kind):
+    expected, actual = make_pair(640, 360, kind)
+    assert image_metrics.mse_similarity(expected, actual) == pytest.approx(
+        numpy_similarity(expected, actual), abs=1e-9)
+
+
+def test_mixed_dtypes_are_compared_as_values():
+    expected = np.full((8, 8), 10, dtype=np.uint8)
+    actual = np.full((8, 8), 12, dtype=np.int16)
+    assert image_metrics.mse_similarity(expected, actual) == pytest.approx(
+        numpy_similarity(expected, actual))
+
+
+def test_empty_images_are_identical():
+    empty = np.zeros((0, 4, 3), dtype=np.uint8)
+    assert image_metrics.mse_similarity(empty, empty) == 100.0
+
+
+def test_shape_mismatch_raises():
+    with pytest.raises(ValueError):
+        image_metrics.mse_similarity(np.zeros((8, 8), np.uint8), np.zeros((8, 9), np.uint8))
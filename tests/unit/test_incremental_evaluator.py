@@ -0,0 +1,77 @@
+"""Tile diff evaluator: incremental results must equal a full recompute."""
+
+import numpy as np
+import pytest
+
+from incremental_evaluator import TileDiffEvaluator
+from image_metrics import mse_to_similarity
+
+
+def full_similarity(frame, baseline):
+    diff = frame.astype(np.float64) - baseline.astype(np.float64)
+    return mse_to_similarity(float(np.mean(diff ** 2)))
+
+
+@pytest.mark.parametrize('shape', [(200, 300, 3), (130, 70), (64, 64, 3)])
+def test_incremental_similarity_equals_full_recompute(shape):
+    rng = np.random.default_rng(sum(shape))
+    baseline = rng.integers(0, 256, size=shape, dtype=np.uint8)
+    frame = baseline.copy()
+    evaluator = TileDiffEvaluator(tile_size=32, baseline=baseline)
+
+    for tick in range(30):
+        # Repaint a few rectangles, sometimes revert to the baseline, sometimes change nothing
+        if tick % 7 == 3:
+            frame = baseline.copy()
+        elif tick % 5 != 4:
+            frame = frame.copy()
+            for _ in range(rng.integers(1, 4)):
+                y, x = rng.integers(0, shape[0]), rng.integers(0, shape[1])
+                h, w = rng.integers(1, 40, size=2)
+                frame[y:y + h, x:x + w] = rng.integers(0, 256)
+        evaluator.update(frame)
+        # Skipping similarity on some ticks must not lose the tiles changed meanwhile
+        if tick % 3 != 1:
+            assert evaluator.similarity() == pytest.approx(full_similarity(frame, baseline), abs=1e-9)
+
+
+def test_changed_tiles_and_boxes():
+    frame = np.zeros((100, 130), dtype=np.uint8)
+    evaluator = TileDiffEvaluator(tile_size=32)
+    assert evaluator.update(frame) == evaluator.changed.size
+    assert evaluator.update(frame.copy()) == 0
+    assert evaluator.changed_boxes() == []
+
+    frame = frame.copy()
+    frame[40, 70] = 255
+    frame[99, 129] = 255
+    assert evaluator.update(frame) == 2
+    assert sorted(evaluator.changed_boxes()) == [(64, 32, 96, 64), (128, 96, 130, 100)]
+    # Grown boxes cover every template position overlapping a changed tile
+    assert sorted(evaluator.changed_boxes(grow=(10, 5))) == [(54, 27, 96, 64), (118, 91, 130, 100)]
+
+
+def test_new_baseline_and_resized_frames_are_recomputed():
+    rng = np.random.default_rng(7)
+    first = rng.integers(0, 256, size=(96, 96), dtype=np.uint8)
+    evaluator = TileDiffEvaluator(tile_size=32, baseline=first)
+    evaluator.update(first)
+    assert evaluator.similarity() == pytest.approx(100.0)
+
+    second = rng.integers(0, 256, size=(96, 96), dtype=np.uint8)
+    evaluator.set_baseline(second)
+    assert evaluator.similarity() == pytest.approx(full_similarity(first, second), abs=1e-9)
+
+    evaluator.set_baseline(first[:64, :64])
+    assert evaluator.update(first[:64, :64]) == 4
+    assert evaluator.similarity() == pytest.approx(100.0)
+
+
+def test_single_channel_change_in_partial_color_tile():
+    frame = np.zeros((70, 100, 3), dtype=np.uint8)
+    evaluator = TileDiffEvaluator(tile_size=32)
+    evaluator.update(frame)
+    frame = frame.copy()
+    frame[69, 99, 2] = 1
+    assert evaluator.update(frame) == 1
+    assert evaluator.changed_boxes() == [(96, 64, 100, 70)]
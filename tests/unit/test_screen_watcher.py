@@ -0,0 +1,122 @@
+"""ScreenWatcher finds templates on full and incremental ticks alike."""
+
+import numpy as np
+import pytest
+
+from screen_watcher import ScreenWatcher
+
+
+def make_screen(seed=0, shape=(240, 320, 3)):
+    # Smooth background: random blocks, so templates cut from noise stand out
+    blocks = np.random.default_rng(seed).integers(0, 255, size=(shape[0] // 16, shape[1] // 16, 3), dtype=np.uint8)
+    return np.kron(blocks, np.ones((16, 16, 1), dtype=np.uint8))
+
+
+def template(height, width, seed=1):
+    return np.random.default_rng(seed).integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+
+
+def frames_grab(frames):
+    frames = iter(frames)
+    last = {}
+
+    def grab(region):
+        last['frame'] = next(frames, last.get('frame'))
+        frame = last['frame']
+        if region is None:
+            return frame
+        x, y, w, h = region
+        return frame[y:y + h, x:x + w]
+    return grab
+
+
+@pytest.mark.parametrize('size', [(12, 20), (40, 30), (80, 96)])
+def test_template_appearing_later_is_found_on_an_incremental_tick(size):
+    screen = make_screen()
+    image = template(*size)
+    shown = screen.copy()
+    shown[117:117 + size[0], 203 - size[1]:203] = image
+    watcher = ScreenWatcher(frames_grab([screen, screen, shown]))
+    watcher.add_target('dialog', image, similarity=0.95)
+
+    match = watcher.wait(timeout=5, interval=0)
+
+    assert match['ticks'] == 3
+    assert (match['x'], match['y']) == (203 - size[1], 117)
+    assert type(match['x']) is int and type(match['y']) is int
+    assert match['score'] >= 0.95
+
+
+def test_region_limits_the_search_and_reports_screen_coordinates():
+    screen = make_screen()
+    image = template(30, 40)
+    screen[100:130, 150:190] = image
+    screen[10:40, 10:50] = image
+    watcher = ScreenWatcher(frames_grab([screen]))
+    watcher.add_target('right', image, region=(120, 80, 120, 100), similarity=0.95)
+
+    match = watcher.wait(timeout=0, interval=0)
+
+    assert (match['name'], match['x'], match['y']) == ('right', 150, 100)
+
+
+def test_first_listed_target_wins_and_missing_targets_time_out():
+    screen = make_screen()
+    first, second = template(24, 24, seed=2), template(24, 24, seed=3)
+    screen[40:64, 40:64] = second
+    screen[140:164, 200:224] = first
+    watcher = ScreenWatcher(frames_grab([screen]))
+    watcher.add_target('first', first, similarity=0.95)
+    watcher.add_target('second', second, similarity=0.95)
+    assert watcher.wait(timeout=0, interval=0)['name'] == 'first'
+
+    absent = ScreenWatcher(frames_grab([make_screen(seed=4)]))
+    absent.add_target('missing', template(24, 24, seed=5), similarity=0.95)
+    assert absent.wait(timeout=0.05, interval=0.01) is None
+
+
+@pytest.mark.parametrize('dx', range(4))
+@pytest.mark.parametrize('dy', range(4))
+def test_fine_detail_template_is_found_at_every_grid_offset(dx, dy):
+    # Noise averages away at 1/4 scale; the coarse level must not rule it out
+    screen = np.random.default_rng(dx * 4 + dy).integers(0, 255, size=(240, 320, 3), dtype=np.uint8)
+    image = template(80, 96)
+    screen[100 + dy:180 + dy, 100 + dx:196 + dx] = image
+    watcher = ScreenWatcher(frames_grab([screen]))
+    watcher.add_target('noise', image, similarity=0.95)
+
+    match = watcher.wait(timeout=0, interval=0)
+
+    assert (match['x'], match['y']) == (100 + dx, 100 + dy)
+
+
+def test_wait_for_any_of_takes_percentages():
+    from ImageComparisonLibrary import ImageComparisonLibrary
+    assert ImageComparisonLibrary._match_fraction(85) == pytest.approx(0.85)
+    assert ImageComparisonLibrary._match_fraction('90.0') == pytest.approx(0.9)
+    assert ImageComparisonLibrary._match_fraction(0.9) == pytest.approx(0.9)
+    with pytest.raises(ValueError):
+        ImageComparisonLibrary._match_fraction(150)
+
+
+def test_coarse_rejected_target_is_rescored_at_full_resolution():
+    screen = make_screen()
+    image = template(80, 96)
+    screen[100:180, 120:216] = image
+    watcher = ScreenWatcher(frames_grab([screen]))
+    target = watcher.add_target('dialog', image, similarity=0.95)
+    # A coarse level that rules the target out although it is on screen
+    target.coarse_threshold = 2.0
+
+    match = watcher.wait(timeout=5, interval=0)
+
+    # The unchanged second frame is searched at full resolution once
+    assert match['ticks'] == 2
+    assert (match['x'], match['y']) == (120, 100)
+
+
+def test_target_names_must_be_unique():
+    watcher = ScreenWatcher(frames_grab([make_screen()]))
+    watcher.add_target('dialog', template(24, 24))
+    with pytest.raises(ValueError):
+        watcher.add_target('dialog', template(24, 24, seed=2))
@@ -0,0 +1,152 @@
+"""Shared baseline cache across real worker processes."""
+
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+import shared_baselines
+from shared_baselines import SharedBaselineCache
+
+SHAPE = (120, 160, 3)
+CONTEXT = multiprocessing.get_context('spawn')
+
+
+def _decode_and_log(log_path):
+    def loader(path):
+        with open(log_path, 'a') as log:
+            log.write('decoded\n')
+        return np.full(SHAPE, 7, dtype=np.uint8)
+    return loader
+
+
+def _worker(image_path, log_path, start, hold, results):
+    cache = SharedBaselineCache()
+    start.wait()
+    view = cache.get(image_path, _decode_and_log(log_path))
+    results.put((cache.segment_name(image_path) in cache._attached, not view.flags.writeable, int(view.sum())))
+    hold.wait(30)
+    cache.close()
+
+
+def _must_not_decode(path):
+    raise AssertionError(f"{path} was decoded although a shared copy exists")
+
+
+def _segment_exists(name):
+    try:
+        shared_memory.SharedMemory(name=name).close()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    path = tmp_path / 'baseline.png'
+    path.write_bytes(b'not decoded by these tests')
+    return path
+
+
+def _start(baseline, log_path, start, hold, results):
+    process = CONTEXT.Process(target=_worker, args=(str(baseline), str(log_path), start, hold, results))
+    process.start()
+    return process
+
+
+def test_concurrent_workers_all_share_one_copy(baseline, tmp_path):
+    log_path = tmp_path / 'decodes.log'
+    start, hold, results = CONTEXT.Barrier(4), CONTEXT.Event(), CONTEXT.Queue()
+    workers = [_start(baseline, log_path, start, hold, results) for _ in range(4)]
+    reports = [results.get(timeout=60) for _ in workers]
+
+    # Every worker, including the ones that lost the creation race, maps the segment
+    assert reports == [(True, True, 7 * int(np.prod(SHAPE)))] * 4
+    cache = SharedBaselineCache()
+    assert int(cache.get(baseline, _must_not_decode).sum()) == 7 * int(np.prod(SHAPE))
+
+    hold.set()
+    for worker in workers:
+        worker.join(60)
+    name = cache.segment_name(baseline)
+    assert _segment_exists(name)
+    cache.close()
+    if shared_baselines.fcntl is not None:
+        assert not _segment_exists(name)
+
+
+def test_segment_outlives_its_creator(baseline, tmp_path):
+    log_path = tmp_path / 'decodes.log'
+    start, hold, results = CONTEXT.Barrier(1), CONTEXT.Event(), CONTEXT.Queue()
+    creator = _start(baseline, log_path, start, hold, results)
+    results.get(timeout=60)
+    cache = SharedBaselineCache()
+    cache.get(baseline, _must_not_decode)
+    hold.set()
+    creator.join(60)
+
+    # A worker started after the creator exited still finds the decoded copy
+    later_start, later_hold = CONTEXT.Barrier(1), CONTEXT.Event()
+    later_hold.set()
+    later = _start(baseline, log_path, later_start, later_hold, results)
+    assert results.get(timeout=60)[0]
+    later.join(60)
+    assert log_path.read_text().count('decoded') == 1
+    cache.close()
+
+
+def test_close_releases_the_mapping(baseline, tmp_path):
+    cache = SharedBaselineCache()
+    view = cache.get(baseline, _decode_and_log(tmp_path / 'decodes.log'))
+    shm, _ = cache._attached[cache.segment_name(baseline)]
+    del view
+    cache.close()
+    assert shm.buf is None
+    assert cache._attached == {}
+
+
+def test_non_uint8_images_are_not_shared(baseline):
+    cache = SharedBaselineCache()
+    image = np.zeros(SHAPE, dtype=np.float32)
+    assert cache.get(baseline, lambda path: image) is image
+    assert cache._attached == {}
+
+
+posix_only = pytest.mark.skipif(shared_baselines.fcntl is None, reason="needs the POSIX segment lock")
+
+
+@posix_only
+def test_unfinished_segment_of_a_crashed_creator_is_replaced_at_once(baseline, tmp_path):
+    cache = SharedBaselineCache(ready_timeout=5.0)
+    name = cache.segment_name(baseline)
+    # What a creator killed while filling the segment leaves behind
+    stale = shared_baselines._open_segment(name, create=True, size=shared_baselines.HEADER_SIZE + 16)
+    shared_baselines.HEADER.pack_into(stale.buf, 0, shared_baselines.MAGIC, shared_baselines.STATE_WRITING,
+                                      4, 4, 0, 0)
+    stale.close()
+
+    started = time.monotonic()
+    view = cache.get(baseline, _decode_and_log(tmp_path / 'decodes.log'))
+    assert time.monotonic() - started < 1.0
+    assert view.shape == SHAPE and int(view.sum()) == 7 * int(np.prod(SHAPE))
+    del view
+    cache.close()
+    assert not _segment_exists(name)
+
+
+@posix_only
+@pytest.mark.skipif(not shared_baselines.SHM_DIR.is_dir(), reason="segments are not listed as files")
+def test_close_evicts_segments_left_behind_by_killed_workers(baseline, tmp_path):
+    leaked = SharedBaselineCache()
+    leaked.get(baseline, _decode_and_log(tmp_path / 'decodes.log'))
+    name = leaked.segment_name(baseline)
+    # A killed worker never detaches: forget the segment without dropping its count
+    leaked._attached.clear()
+    day_old = time.time() - 25 * 3600
+    os.utime(shared_baselines.SHM_DIR / name, (day_old, day_old))
+
+    SharedBaselineCache(max_age=24 * 3600).close()
+    assert not _segment_exists(name)
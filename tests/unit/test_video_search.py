@@ -0,0 +1,86 @@
+"""Frame search in recorded videos: hash prefilter, index reuse and size checks."""
+
+import queue
+
+import cv2
+import numpy as np
+import pytest
+
+import video_search
+
+SIZE = (160, 120)  # width, height
+FPS = 10.0
+
+
+def screen(seed):
+    blocks = np.random.default_rng(seed).integers(0, 255, size=(SIZE[1] // 20, SIZE[0] // 20, 3), dtype=np.uint8)
+    return np.kron(blocks, np.ones((20, 20, 1), dtype=np.uint8))
+
+
+@pytest.fixture
+def video(tmp_path):
+    # Frames 0-9 show screen A, 10-19 screen B, 20-29 screen A again
+    path = tmp_path / 'recording.avi'
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), FPS, SIZE)
+    if not writer.isOpened():
+        pytest.skip("No MJPG video encoder available")
+    for state in [0] * 10 + [1] * 10 + [0] * 10:
+        writer.write(screen(state))
+    writer.release()
+    return path
+
+
+def test_finds_every_frame_of_a_state(video):
+    matches = video_search.find_matching_frames(video, screen(1), threshold=95.0)
+    assert [m['frame'] for m in matches] == list(range(10, 20))
+    assert matches[0]['time'] == pytest.approx(1.0)
+
+
+def test_first_only_and_region(video):
+    region = (20, 20, 60, 40)
+    part = screen(0)[20:60, 20:80]
+    matches = video_search.find_matching_frames(video, part, threshold=95.0, region=region, first_only=True)
+    assert [m['frame'] for m in matches] == [0]
+    assert video_search.region_key(region) in video_search.load_index(video)['regions']
+
+
+def test_image_of_another_size_is_rejected(video):
+    with pytest.raises(ValueError, match='compared frame area'):
+        video_search.find_matching_frames(video, screen(1)[:40, :40])
+
+
+def test_sparse_index_is_not_reused_for_dense_searches(video):
+    sparse = video_search.find_matching_frames(video, screen(1), threshold=95.0, step=5)
+    assert [m['frame'] for m in sparse] == [10, 15]
+    dense = video_search.find_matching_frames(video, screen(1), threshold=95.0)
+    assert [m['frame'] for m in dense] == list(range(10, 20))
+    # ...while a dense index serves sparse searches without rebuilding
+    assert [m['frame'] for m in video_search.find_matching_frames(video, screen(1), threshold=95.0, step=5)] == [10, 15]
+    assert set(video_search.load_index(video)['regions']) == {'full', 'full/5'}
+
+
+def test_regions_indexed_while_recording_are_not_rebuilt(video, monkeypatch):
+    from VideoRecorderLibrary import VideoRecorderLibrary
+
+    region = (20, 20, 60, 40)
+    recorder = VideoRecorderLibrary()
+    recorder.fps = FPS
+    recorder.screen_size = SIZE
+    recorder.current_video_path = video
+    recorder._index_regions = recorder._parse_index_regions('20,20,60,40;0,0,40,40')
+    recorder._frame_index = {video_search.region_key(r): [] for r in [None] + recorder._index_regions}
+    recorder._stats = {'frames_written': 0, 'encode_ms': 0.0}
+    recorder.frame_queue = queue.Queue()
+    for state in [0] * 10 + [1] * 10 + [0] * 10:
+        recorder.frame_queue.put(screen(state))
+    recorder.frame_queue.put(None)
+    recorder._encode_frames()
+    recorder._save_frame_index()
+
+    def no_rebuild(*args, **kwargs):
+        raise AssertionError("index rebuilt")
+    monkeypatch.setattr(video_search, 'build_index', no_rebuild)
+    part = screen(1)[20:60, 20:80]
+    matches = video_search.find_matching_frames(video, part, threshold=95.0, region=region)
+    assert [m['frame'] for m in matches] == list(range(10, 20))
+    assert set(video_search.load_index(video)['regions']) == {'full', '20,20,60,40', '0,0,40,40'}
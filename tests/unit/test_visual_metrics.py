@@ -0,0 +1,108 @@
+"""Visual metrics: events are attributed to the keyword that recorded them and exported per keyword."""
+
+import json
+
+import pytest
+
+import VisualMetricsListener as listener_module
+from visual_metrics import METRICS, MetricsRecorder, summarize
+from VisualMetricsListener import VisualMetricsListener
+
+
+@pytest.fixture
+def listener(tmp_path):
+    listener = VisualMetricsListener(output=str(tmp_path / 'metrics.jsonl'), summary='True')
+    listener.start_suite('Suite', {})
+    yield listener
+    listener.close()
+    METRICS.enabled = False
+    METRICS.drain()
+
+
+def keyword_attrs(name, status='PASS', elapsed=12):
+    return {'kwname': name, 'libname': 'ImageComparisonLibrary', 'status': status,
+            'starttime': '20261019 10:00:00.000', 'elapsedtime': elapsed}
+
+
+def read_records(listener):
+    return [json.loads(line) for line in open(listener.output, encoding='utf-8')]
+
+
+def test_disabled_recorder_keeps_nothing():
+    recorder = MetricsRecorder()
+    with recorder.phase('Lib', 'decode'):
+        pass
+    recorder.add_bytes('Lib', 'png', 10)
+    recorder.set_value('Lib', 'ticks', 3)
+    assert recorder.drain() == []
+
+
+def test_summarize_sums_phases_and_bytes_and_keeps_the_last_value():
+    recorder = MetricsRecorder()
+    recorder.enabled = True
+    recorder.add_phase_time('Lib', 'decode', 1.5)
+    recorder.add_phase_time('Lib', 'decode', 2.0)
+    recorder.add_bytes('Lib', 'png', 100)
+    recorder.add_bytes('Lib', 'png', 28)
+    recorder.set_value('Lib', 'ticks', 1)
+    recorder.set_value('Lib', 'ticks', 4)
+    assert summarize(recorder.drain()) == {
+        'phases_ms': {'decode': 3.5}, 'bytes': {'png': 128}, 'values': {'ticks': 4}}
+    assert recorder.drain() == []
+
+
+def test_events_are_attributed_to_the_keyword_that_recorded_them(listener):
+    METRICS.add_phase_time('ImageComparisonLibrary', 'before_test', 1.0)
+    listener.start_test('Case', {'longname': 'Suite.Case'})
+
+    # A nested keyword ends first and takes its own events with it
+    METRICS.add_phase_time('ImageComparisonLibrary', 'decode', 2.0)
+    listener.end_keyword('Compare Images', keyword_attrs('Compare Images'))
+    METRICS.add_bytes('ImageComparisonLibrary', 'diff_png', 2048)
+    listener.end_keyword('Wrapper', keyword_attrs('Wrapper', elapsed=30))
+    # Keywords without events produce no record
+    listener.end_keyword('Log', keyword_attrs('Log'))
+
+    records = read_records(listener)
+    assert [r['keyword'] for r in records] == ['Compare Images', 'Wrapper']
+    assert records[0]['phases_ms'] == {'decode': 2.0}
+    assert records[0]['bytes'] == {}
+    assert records[1]['phases_ms'] == {}
+    assert records[1]['bytes'] == {'diff_png': 2048}
+
+
+def test_record_shape(listener):
+    listener.start_test('Case', {'longname': 'Suite.Case'})
+    METRICS.add_phase_time('VideoRecorderLibrary', 'encode', 5.25)
+    METRICS.set_value('VideoRecorderLibrary', 'capture_fps', 9.8)
+    listener.end_keyword('Stop Video Recording', {'kwname': 'Stop Video Recording', 'libname': '',
+                                                  'status': 'PASS', 'starttime': 'start', 'elapsedtime': 7})
+
+    [record] = read_records(listener)
+    assert record == {
+        'test': 'Suite.Case', 'keyword': 'Stop Video Recording',
+        # Without a library name from Robot, the reporting library is used
+        'library': 'VideoRecorderLibrary', 'status': 'PASS', 'start': 'start', 'elapsed_ms': 7,
+        'phases_ms': {'encode': 5.25}, 'bytes': {}, 'values': {'capture_fps': 9.8},
+    }
+
+
+def test_summary_is_logged_per_test_with_escaped_names(listener, monkeypatch):
+    logged = []
+    monkeypatch.setattr(listener_module.logger, 'info', lambda message, html=False: logged.append((message, html)))
+
+    listener.start_test('Case', {'longname': 'Suite.Case'})
+    METRICS.add_phase_time('ImageComparisonLibrary', 'match', 4.0)
+    listener.end_keyword('Embedded <b>', keyword_attrs('Click "<b>" & Wait'))
+    listener.end_test('Case', {})
+
+    [(message, html)] = logged
+    assert html
+    assert 'Click &quot;&lt;b&gt;&quot; &amp; Wait' in message
+    assert '<b>' not in message
+    assert 'match: 4.0 ms' in message
+
+    # Nothing is logged for a test without metrics
+    listener.start_test('Other', {'longname': 'Suite.Other'})
+    listener.end_test('Other', {})
+    assert len(logged) == 1
@@ -0,0 +1,176 @@
+"""Window backends: the fake desktop, backend selection and Win32 geometry/DPI handling."""
+
+import ctypes
+import sys
+import types
+
+import numpy as np
+import pytest
+
+import window_backends
+from window_backends import FakeWindowBackend, Win32WindowBackend, get_window_backend, intersect
+
+
+class MovingWindowBackend(FakeWindowBackend):
+    """Fake desktop whose window rectangle animates for a few reads after a restore."""
+
+    def __init__(self, steps):
+        super().__init__(400, 300)
+        self.steps = list(steps)
+        self.reads = 0
+
+    def get_rect(self, handle):
+        self.reads += 1
+        if self.steps:
+            return self.steps.pop(0)
+        return super().get_rect(handle)
+
+
+def test_intersect():
+    assert intersect((10, 10, 50, 40), (0, 0, 30, 30)) == (10, 10, 20, 20)
+    assert intersect((-20, 5, 30, 10), (0, 0, 100, 100)) == (0, 5, 10, 10)
+    assert intersect((200, 0, 10, 10), (0, 0, 100, 100)) is None
+
+
+def test_fake_windows_are_found_top_most_first():
+    desktop = FakeWindowBackend(400, 300)
+    back = desktop.add_window('AgileMark Setup', 10, 10, 100, 80)
+    front = desktop.add_window('AgileMark 1.1', 50, 40, 120, 90)
+    assert desktop.find_window('agilemark') == front
+    assert desktop.find_window('SETUP') == back
+    assert desktop.find_window('Notepad') is None
+
+    desktop.set_foreground(back)
+    assert [handle for handle, _ in desktop.list_windows()] == [back, front]
+    desktop.close_window(back)
+    assert desktop.find_window('setup') is None
+
+
+def test_fake_minimize_maximize_and_restore():
+    desktop = FakeWindowBackend(400, 300)
+    handle = desktop.add_window('AgileMark', 20, 30, 100, 80)
+
+    desktop.show_window(handle, 'minimize')
+    assert desktop.is_minimized(handle)
+    assert desktop.get_rect(handle) == (-32000, -32000, 160, 28)
+    desktop.show_window(handle, 'restore')
+    assert desktop.get_rect(handle) == (20, 30, 100, 80)
+
+    desktop.show_window(handle, 'maximize')
+    assert desktop.get_rect(handle) == (0, 0, 400, 300)
+    desktop.show_window(handle, 'restore')
+    assert desktop.get_rect(handle) == (20, 30, 100, 80)
+    with pytest.raises(ValueError):
+        desktop.show_window(handle, 'hide')
+
+
+def test_fake_capture_paints_the_window_and_clips_to_the_screen():
+    desktop = FakeWindowBackend(400, 300)
+    content = np.full((80, 100, 3), (10, 20, 30), dtype=np.uint8)
+    handle = desktop.add_window('AgileMark', 350, 250, 100, 80, content=content)
+
+    capture = desktop.capture((340, 240, 100, 80))
+    assert capture.shape == (80, 100, 3)
+    # Window from (350, 250) up to the screen edge, black beyond it
+    assert (capture[10:60, 10:60] == (10, 20, 30)).all()
+    assert (capture[60:, 60:] == 0).all()
+    assert (capture[:10, :10] != (10, 20, 30)).any()
+
+    desktop.move_window(handle, 0, 0)
+    assert (desktop.capture((0, 0, 100, 80)) == (10, 20, 30)).all()
+
+
+def test_stable_rect_waits_for_the_animation_to_end():
+    final = (20, 30, 100, 80)
+    desktop = MovingWindowBackend([(200, 150, 10, 8), (100, 80, 50, 40), (40, 50, 90, 70)])
+    handle = desktop.add_window('AgileMark', *final)
+    assert desktop.wait_for_stable_rect(handle, timeout=5, interval=0) == final
+    assert desktop.reads == 5
+
+    # Without time to settle, the first read is returned
+    desktop = MovingWindowBackend([(200, 150, 10, 8), (100, 80, 50, 40)])
+    handle = desktop.add_window('AgileMark', *final)
+    assert desktop.wait_for_stable_rect(handle, timeout=0) == (200, 150, 10, 8)
+
+
+def test_capture_window_by_title_waits_for_the_window_to_settle(tmp_path):
+    from ImageComparisonLibrary import ImageComparisonLibrary
+
+    desktop = MovingWindowBackend([])
+    handle = desktop.add_window('AgileMark', 20, 30, 100, 80)
+    desktop.show_window(handle, 'minimize')
+    # Restore animation: the rectangle grows from the task bar for a few reads
+    desktop.steps = [(150, 280, 10, 8), (100, 180, 50, 40), (20, 30, 100, 80)]
+    library = ImageComparisonLibrary()
+    library._window_backend = desktop
+
+    title, rect = library._window_rect('agilemark', activate=True, settle=5.0)
+    assert (title, rect) == ('AgileMark', (20, 30, 100, 80))
+
+    desktop.steps = [(150, 280, 10, 8)]
+    assert library._window_rect('agilemark', activate=True, settle=0)[1] == (150, 280, 10, 8)
+
+
+def test_backends_are_selected_by_name_and_shared(monkeypatch):
+    monkeypatch.setattr(window_backends, '_backends', {})
+    assert isinstance(get_window_backend('auto'), Win32WindowBackend)
+    assert get_window_backend() is get_window_backend('win32')
+    fake = get_window_backend('fake')
+    assert isinstance(fake, FakeWindowBackend)
+    assert get_window_backend('fake') is fake
+
+    module = types.ModuleType('custom_backends')
+    module.Desktop = type('Desktop', (FakeWindowBackend,), {})
+    monkeypatch.setitem(sys.modules, 'custom_backends', module)
+    assert isinstance(get_window_backend('custom_backends.Desktop'), module.Desktop)
+
+    with pytest.raises(ValueError, match='Unknown window backend'):
+        get_window_backend('x11')
+
+
+@pytest.mark.skipif(hasattr(ctypes, 'windll'), reason="user32.dll is available")
+def test_win32_backend_imports_anywhere_but_needs_windows_to_run():
+    backend = Win32WindowBackend()
+    with pytest.raises(RuntimeError, match='requires Windows'):
+        backend.list_windows()
+
+
+class FakeWinDLL:
+    """Stand-in for ``ctypes.windll`` filling RECTs like user32 and dwmapi do."""
+
+    def __init__(self, frame_bounds, window_rect):
+        self.calls = []
+
+        def set_dpi_aware():
+            self.calls.append('SetProcessDPIAware')
+
+        def fill(rect_ref, values):
+            rect = rect_ref._obj
+            rect.left, rect.top, rect.right, rect.bottom = values
+
+        def dwm_attribute(hwnd, attribute, rect_ref, size):
+            if frame_bounds is None:
+                return 0x80004005  # E_FAIL, e.g. with desktop composition off
+            fill(rect_ref, frame_bounds)
+            return 0
+
+        self.user32 = types.SimpleNamespace(SetProcessDPIAware=set_dpi_aware,
+                                            GetWindowRect=lambda hwnd, rect_ref: fill(rect_ref, window_rect))
+        self.dwmapi = types.SimpleNamespace(DwmGetWindowAttribute=dwm_attribute)
+
+
+def test_win32_rect_prefers_the_visible_frame_and_is_dpi_aware(monkeypatch):
+    # Visible frame without the invisible 7 px resize borders of GetWindowRect
+    windll = FakeWinDLL(frame_bounds=(100, 50, 900, 650), window_rect=(93, 50, 907, 657))
+    monkeypatch.setattr(ctypes, 'windll', windll, raising=False)
+    backend = Win32WindowBackend()
+    assert backend.get_rect(0x10010) == (100, 50, 800, 600)
+    assert backend.get_rect(0x10010) == (100, 50, 800, 600)
+    # Physical pixels: DPI awareness is switched on once, before the first window call
+    assert windll.calls == ['SetProcessDPIAware']
+
+
+def test_win32_rect_falls_back_to_the_window_rect(monkeypatch):
+    windll = FakeWinDLL(frame_bounds=None, window_rect=(93, 50, 907, 657))
+    monkeypatch.setattr(ctypes, 'windll', windll, raising=False)
+    assert Win32WindowBackend().get_rect(0x10010) == (93, 50, 814, 607)